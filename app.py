@@ -2,15 +2,23 @@ from flask import Flask
 from flask_login import LoginManager
 import os
 from dotenv import load_dotenv
-from models import db, migrate, User
+from models import db, migrate
+from models.pool import engine_options, init_sqlite_pragmas
+from models.replicas import replica_router
+from models.settings_writer import settings_writer
+from models.instrumentation import init_sql_instrumentation
 from routes import bp as main_bp
 from auth import bp as auth_bp
 from routes.calsys import bp as calsys_bp
+from routes.export_jobs import export_jobs
+from routes.json_provider import init_json_provider
+from models.user_cache import user_cache
 
 # Load environment variables
 load_dotenv()
 
-def create_app():
+def create_app(config=None):
+    """Create the application; ``config`` overrides the environment-based settings"""
     app = Flask(__name__)
     
     # Set secret key for session management
@@ -18,14 +26,90 @@ def create_app():
 
     # Database configurations
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'  # Main database (SQLite)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options('SQLITE', None)
     app.config['SQLALCHEMY_BINDS'] = {
-        'calsys': f"mysql+mysqlconnector://{os.getenv('CALSYS_USER')}:{os.getenv('CALSYS_PASSWORD')}@{os.getenv('CALSYS_HOST')}/{os.getenv('CALSYS_DATABASE')}"
+        'calsys': {
+            'url': f"mysql+mysqlconnector://{os.getenv('CALSYS_USER')}:{os.getenv('CALSYS_PASSWORD')}@{os.getenv('CALSYS_HOST')}/{os.getenv('CALSYS_DATABASE')}",
+            # Recycle below MySQL's wait_timeout and ping so idle or restarted
+            # connections are replaced instead of failing the request
+            **engine_options(
+                'CALSYS', 'calsys',
+                pool_size=5, max_overflow=10, pool_timeout=30,
+                pool_recycle=1800, pool_pre_ping=True
+            )
+        }
     }
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    # calsys read replicas (comma separated URLs) for GET requests, exports and the dashboard
+    app.config['CALSYS_REPLICA_URLS'] = [url for url in os.getenv('CALSYS_REPLICA_URLS', '').split(',') if url]
+    app.config['CALSYS_REPLICA_STRATEGY'] = os.getenv('CALSYS_REPLICA_STRATEGY', 'round-robin')
+    app.config['CALSYS_REPLICA_MAX_LAG'] = float(os.getenv('CALSYS_REPLICA_MAX_LAG', 30))
+    app.config['CALSYS_REPLICA_LAG_CHECK_INTERVAL'] = float(os.getenv('CALSYS_REPLICA_LAG_CHECK_INTERVAL', 5))
+    app.config['CALSYS_REPLICA_RETRY_INTERVAL'] = float(os.getenv('CALSYS_REPLICA_RETRY_INTERVAL', 30))
+    
+    # Per-request SQL timing (Server-Timing header and slow query log)
+    app.config['SQL_INSTRUMENTATION'] = os.getenv('SQL_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes', 'on')
+    app.config['SQL_SLOW_QUERY_MS'] = float(os.getenv('SQL_SLOW_QUERY_MS', 200))
+    
+    # Reference table cache
+    app.config['REFERENCE_CACHE_TTL'] = int(os.getenv('REFERENCE_CACHE_TTL', 300))
+    app.config['REFERENCE_CACHE_MAX_ROWS'] = int(os.getenv('REFERENCE_CACHE_MAX_ROWS', 10000))
+    
+    # Calibration due snapshot
+    app.config['CALIBRATION_DUE_REFRESH_INTERVAL'] = int(os.getenv('CALIBRATION_DUE_REFRESH_INTERVAL', 60))
+    
+    # Latest calibration per device: seconds between timeStamp syncs of latestCalibration
+    app.config['LATEST_CALIBRATION_SYNC_INTERVAL'] = int(os.getenv('LATEST_CALIBRATION_SYNC_INTERVAL', 60))
+    
+    # JSON encoding: orjson (falls back to Flask's if not installed) or default
+    app.config['JSON_PROVIDER'] = os.getenv('JSON_PROVIDER', 'orjson')
+    app.config['JSON_ISO_DATES'] = os.getenv('JSON_ISO_DATES', '').lower() in ('1', 'true', 'yes', 'on')
+    
+    # Logged-in user and settings cache
+    app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 1024))
+    app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', 60))
+    
+    # User settings writes are batched; SQLite waits this long for locks
+    app.config['SETTINGS_FLUSH_INTERVAL'] = float(os.getenv('SETTINGS_FLUSH_INTERVAL', 0.5))
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    
+    # Search index: fts5 (local sidecar), mysql (calsys FULLTEXT) or like
+    app.config['SEARCH_BACKEND'] = os.getenv('SEARCH_BACKEND', 'fts5')
+    app.config['SEARCH_INDEX_REFRESH_INTERVAL'] = int(os.getenv('SEARCH_INDEX_REFRESH_INTERVAL', 30))
+    app.config['SEARCH_MAX_MATCHES'] = int(os.getenv('SEARCH_MAX_MATCHES', 2000))
+    
+    # Calibration KPI aggregates
+    app.config['KPI_CACHE_TTL'] = int(os.getenv('KPI_CACHE_TTL', 60))
+    
+    # Dashboard summary fan-out
+    app.config['DASHBOARD_WORKERS'] = int(os.getenv('DASHBOARD_WORKERS', 4))
+    app.config['DASHBOARD_SECTION_TIMEOUT'] = float(os.getenv('DASHBOARD_SECTION_TIMEOUT', 5))
+    app.config['DASHBOARD_DUE_DAYS'] = int(os.getenv('DASHBOARD_DUE_DAYS', 30))
+    
+    # Bulk calibration imports
+    app.config['IMPORT_MAX_ROWS'] = int(os.getenv('IMPORT_MAX_ROWS', 100000))
+    app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', 5000))
+    
+    # Background export jobs
+    app.config['EXPORT_SPOOL_DIR'] = os.getenv('EXPORT_SPOOL_DIR') or os.path.join(app.instance_path, 'exports')
+    app.config['EXPORT_JOB_WORKERS'] = int(os.getenv('EXPORT_JOB_WORKERS', 2))
+    app.config['EXPORT_JOB_TTL'] = int(os.getenv('EXPORT_JOB_TTL', 3600))
+    
+    if config:
+        app.config.update(config)
+    
     # Initialize extensions
+    init_json_provider(app)
+    replica_router.init_app(app)
     db.init_app(app)
     migrate.init_app(app, db)
+    export_jobs.init_app(app)
+    settings_writer.init_app(app)
+    init_sql_instrumentation(app)
+    with app.app_context():
+        init_sqlite_pragmas(app, db.engines)
+        replica_router.init_engines(db.engines)
     
     # Initialize login manager
     login_manager = LoginManager()
@@ -34,18 +118,28 @@ def create_app():
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load_user(user_id)
     
     # Register blueprints
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(calsys_bp)
     
-    with app.app_context():
-        db.create_all()
+    # Schema work is a deploy step, so workers start without touching a database
+    @app.cli.command('init-db')
+    def init_db():
+        """Create any missing tables on every bind but the read replicas"""
+        create_tables(app)
+        print('Created missing tables')
     
     return app
 
+def create_tables(app):
+    """Create missing tables; replicas only ever receive reads"""
+    with app.app_context():
+        db.create_all(bind_key=[key for key in db.engines if key not in replica_router.replicas])
+
 if __name__ == '__main__':
     app = create_app()
+    create_tables(app)
     app.run(debug=True)
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash
 from flask_login import login_user, logout_user, login_required, current_user
 from models import db, User, UserSettings
+from models.user_cache import user_cache
 from werkzeug.security import generate_password_hash
 
 bp = Blueprint('auth', __name__)
@@ -19,11 +20,6 @@ def login():
         
         if user and user.check_password(password):
             login_user(user, remember=remember)
-            # Create user settings if they don't exist
-            if not UserSettings.query.filter_by(user_id=user.id).first():
-                settings = UserSettings(user_id=user.id)
-                db.session.add(settings)
-                db.session.commit()
             next_page = request.args.get('next')
             return redirect(next_page if next_page else url_for('main.index'))
         else:
@@ -34,6 +30,7 @@ def login():
 @bp.route('/logout')
 @login_required
 def logout():
+    user_cache.invalidate(current_user.id)
     logout_user()
     return redirect(url_for('auth.login'))
 
@@ -0,0 +1,341 @@
+"""Endpoint benchmarks for the calsys API against a synthetic local dataset
+
+The ``calsys`` bind is pointed at a SQLite file seeded with N devices and
+M calibrations per device, then every calsys endpoint is driven through the
+Flask test client. Each scenario reports latency percentiles, SQL statements
+per request and peak Python memory; results can be saved as a JSON baseline
+and compared against an earlier run:
+
+    python -m benchmarks.calsys --devices 2000 --calibrations 10 --output baseline.json
+    python -m benchmarks.calsys --devices 2000 --calibrations 10 --baseline baseline.json
+
+Runs are reproducible for the same ``--seed`` and dataset size.
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateColumn
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, create_tables
+from models import db
+from models.latest_calibration import rebuild_latest_calibrations
+from models.calsys import (
+    CalibratedBy, Calibration, Device, Employee, Location, Owner, Period, Source, Status, Type
+)
+
+# Rows per reference table, roughly the shape of the production calsys data
+LOOKUP_SIZES = {
+    Location: 25,
+    Type: 60,
+    Owner: 12,
+    Source: 150,
+    Employee: 40,
+    CalibratedBy: 15
+}
+PERIODS = {'3M': ('Quarterly', 91), '6M': ('Semi-annual', 182), '1Y': ('Annual', 365), '2Y': ('Biennial', 730)}
+STATUSES = {'Active': 'Active', 'CalInv': 'Calibrated in inventory', 'Inactive': 'Inactive', 'Retired': 'Retired'}
+DEVICE_NAMES = ('Caliper', 'Micrometer', 'Torque Wrench', 'Pressure Gauge', 'Multimeter',
+                'Thermometer', 'Scale', 'Height Gauge', 'Bore Gauge', 'Oscilloscope')
+
+INSERT_BATCH_SIZE = 5000
+
+@compiles(CreateColumn, 'sqlite')
+def sqlite_create_column(element, compiler, **kw):
+    """Drop MySQL's ON UPDATE clause from timeStamp defaults so SQLite accepts them"""
+    return compiler.visit_create_column(element, **kw).replace(' ON UPDATE CURRENT_TIMESTAMP', '')
+
+def build_app(workdir, calsys_url=None):
+    """Application with both binds on SQLite files in ``workdir``, tables created and login disabled
+
+    ``calsys_url`` points the calsys bind at an existing database instead.
+    """
+    app = create_app({
+        'TESTING': True,
+        'LOGIN_DISABLED': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'database.db')}",
+        'SQLALCHEMY_BINDS': {'calsys': calsys_url or f"sqlite:///{os.path.join(workdir, 'calsys.db')}"},
+        'EXPORT_SPOOL_DIR': os.path.join(workdir, 'exports')
+    })
+    if calsys_url is None:
+        create_tables(app)
+    else:
+        # Leave the existing calsys schema alone
+        with app.app_context():
+            db.create_all(bind_key=None)
+    return app
+
+def insert_rows(model, rows):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.execute(db.insert(model), rows[start:start + INSERT_BATCH_SIZE])
+
+def seed(devices, calibrations, seed=1):
+    """Fill the calsys bind with a deterministic synthetic dataset"""
+    rng = random.Random(seed)
+    stamp = datetime(2024, 1, 1)
+
+    lookup_ids = {}
+    for model, size in LOOKUP_SIZES.items():
+        prefix = model.__tablename__[:3].upper()
+        rows = [{'ID': f'{prefix}{i:03d}', 'name': f'{model.__name__} {i}', 'created_at': stamp, 'updated_at': stamp}
+                for i in range(size)]
+        if model is Employee:
+            for row in rows:
+                row['userInit'] = ''.join(rng.choice('ABCDEFGHJKLMNPRSTW') for _ in range(3))
+        insert_rows(model, rows)
+        lookup_ids[model] = [row['ID'] for row in rows]
+    insert_rows(Period, [{'ID': key, 'name': name, 'created_at': stamp, 'updated_at': stamp}
+                         for key, (name, days) in PERIODS.items()])
+    insert_rows(Status, [{'ID': key, 'name': name, 'created_at': stamp, 'updated_at': stamp}
+                         for key, name in STATUSES.items()])
+
+    device_rows = []
+    calibration_rows = []
+    today = date.today()
+    for device_id in range(1, devices + 1):
+        period = rng.choice(list(PERIODS))
+        interval = timedelta(days=PERIODS[period][1])
+        init_date = today - interval * calibrations - timedelta(days=rng.randint(0, 365))
+        device_rows.append({
+            'ID': device_id,
+            'name': f'{rng.choice(DEVICE_NAMES)} {device_id:05d}',
+            'description': f'{rng.choice(DEVICE_NAMES)} model {rng.randint(100, 999)}',
+            'sourceID': rng.choice(lookup_ids[Source]),
+            'typeID': rng.choice(lookup_ids[Type]),
+            'initDate': init_date,
+            'period': period,
+            'location': rng.choice(lookup_ids[Location]),
+            'ownerID': rng.choice(lookup_ids[Owner]),
+            'serialNumber': f'SN{rng.randint(0, 10 ** 9):09d}',
+            'timeStamp': stamp,
+            'created_at': stamp,
+            'updated_at': stamp
+        })
+
+        cal_date = init_date
+        for i in range(calibrations):
+            cal_date += interval + timedelta(days=rng.randint(-14, 14))
+            latest = i == calibrations - 1
+            calibration_rows.append({
+                'deviceID': str(device_id),
+                'calibratedByID': rng.choice(lookup_ids[CalibratedBy]),
+                'employeeID': rng.choice(lookup_ids[Employee]),
+                'calDate': cal_date,
+                'calDue': cal_date + interval,
+                'status': rng.choice(list(STATUSES)) if latest else 'Active',
+                'record': f'\\\\records\\cal\\{device_id:05d}-{i}.pdf',
+                'timeStamp': stamp,
+                'created_at': stamp,
+                'updated_at': stamp
+            })
+
+    insert_rows(Device, device_rows)
+    insert_rows(Calibration, calibration_rows)
+    db.session.commit()
+    rebuild_latest_calibrations()
+    # Statistics, as a production database keeps, so SQLite joins the
+    # calibration history through the far smaller latest-calibration table
+    for table in ('calibration', 'latestCalibration'):
+        db.session.execute(db.text(f'ANALYZE "{table}"'), bind_arguments={'mapper': Calibration})
+    db.session.commit()
+
+def get(path, **headers):
+    return lambda client: client.get(path, headers=headers)
+
+def conditional_get(path):
+    """Revalidate ``path`` with the ETag of a first response, expecting a 304"""
+    etags = {}
+
+    def request(client):
+        if path not in etags:
+            etags[path] = client.get(path).headers.get('ETag')
+        return client.get(path, headers={'If-None-Match': etags[path]})
+    return request
+
+def export_job(source, format='csv'):
+    """Submit a background export, wait for it and download the file"""
+    runs = iter(range(sys.maxsize))
+
+    def request(client):
+        # A distinct arg per run keeps the job from being deduplicated
+        job = client.post(f'/api/calsys/exports/{source}?format={format}&run={next(runs)}').get_json()
+        while job['status'] in ('queued', 'running'):
+            time.sleep(0.005)
+            job = client.get(job['status_url']).get_json()
+        return client.get(job['download_url'])
+    return request
+
+SCENARIOS = [
+    ('devices', get('/api/calsys/devices')),
+    ('devices-deep-page', get('/api/calsys/devices?page=150&per_page=50')),
+    ('devices-cursor', get('/api/calsys/devices?cursor=&per_page=50')),
+    ('devices-search', get('/api/calsys/devices?search=gauge&per_page=50')),
+    ('devices-search-serial', get('/api/calsys/devices?search=SN12&per_page=50')),
+    ('devices-filtered', get('/api/calsys/devices?location=LOC003&sort_by=serialNumber')),
+    ('devices-not-modified', conditional_get('/api/calsys/devices')),
+    ('calibrations', get('/api/calsys/calibrations')),
+    ('calibrations-deep-page', get('/api/calsys/calibrations?page=500&per_page=50')),
+    ('calibrations-cursor', get('/api/calsys/calibrations?cursor=&per_page=50')),
+    ('calibrations-search', get('/api/calsys/calibrations?search=caliper&per_page=50')),
+    ('calibrations-filtered', get('/api/calsys/calibrations?status=Active&start_date=2023-01-01&employee_id=EMP007')),
+    ('datatables-devices', get('/api/calsys/datatables/devices?draw=1&start=40&length=25&order[0][column]=1'
+                               '&order[0][dir]=asc&columns[0][data]=ID&columns[1][data]=name&search[value]=')),
+    ('datatables-calibrations-search', get('/api/calsys/datatables/calibrations?draw=2&start=0&length=25'
+                                           '&search[value]=caliper')),
+    ('lookup-types', get('/api/calsys/lookup/types')),
+    ('lookup-employees-search', get('/api/calsys/lookup/employees?search=1&sort_by=ID')),
+    ('lookup-sources-cursor', get('/api/calsys/lookup/sources?cursor=&per_page=50')),
+    ('calibration-due', get('/api/calsys/calibration-due')),
+    ('calibration-due-location-page', get('/api/calsys/calibration-due?location=LOC003&per_page=25')),
+    ('dashboard', get('/api/calsys/dashboard')),
+    ('kpis-location-status', get('/api/calsys/kpis?group_by=location,status')),
+    ('cal-export', get('/api/calsys/cal-export')),
+    ('cal-export-location-cursor', get('/api/calsys/cal-export?location=LOC003&cursor=&per_page=25')),
+    ('export-devices-csv', get('/api/calsys/devices?export=1&format=csv')),
+    ('export-devices-excel', get('/api/calsys/devices?export=1&format=excel')),
+    ('export-calibrations-csv', get('/api/calsys/calibrations?export=1&format=csv')),
+    ('export-calibrations-excel', get('/api/calsys/calibrations?export=1&format=excel')),
+    ('export-calibration-due-csv', get('/api/calsys/calibration-due?export=1&format=csv')),
+    ('export-cal-export-excel', get('/api/calsys/cal-export?export=1&format=excel')),
+    ('export-job-calibrations-csv', export_job('calibrations')),
+]
+
+class QueryCounter:
+    """Counts statements executed on every engine, including export workers"""
+
+    def __init__(self, engines):
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self.increment)
+
+    def increment(self, *args):
+        self.count += 1
+
+def percentile(values, pct):
+    """Linearly interpolated percentile of a sorted list"""
+    if len(values) == 1:
+        return values[0]
+    position = (len(values) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def run_scenario(client, counter, request, iterations, warmup):
+    """Time ``iterations`` requests after ``warmup`` untimed ones
+
+    Peak memory comes from one extra traced request, since tracing every
+    allocation would distort the timings.
+    """
+    for _ in range(warmup):
+        request(client).close()
+
+    timings = []
+    statuses = set()
+    queries = 0
+    for _ in range(iterations):
+        before = counter.count
+        start = time.perf_counter()
+        response = request(client)
+        size = len(response.get_data())
+        timings.append(time.perf_counter() - start)
+        queries += counter.count - before
+        statuses.add(response.status_code)
+        response.close()
+
+    tracemalloc.start()
+    try:
+        request(client).get_data()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'status': sorted(statuses),
+        'bytes': size,
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'mean_ms': round(sum(timings) * 1000 / len(timings), 3),
+        'queries': round(queries / iterations, 2),
+        'peak_memory_kb': round(peak / 1024, 1)
+    }
+
+def change(current, previous):
+    if not previous:
+        return ''
+    return f'{(current - previous) / previous * 100:+.1f}%'
+
+def report(results, baseline=None):
+    """Print one line per scenario, with changes against ``baseline`` if given"""
+    previous = (baseline or {}).get('scenarios', {})
+    print(f"{'scenario':<30} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'peak KiB':>10}  status")
+    for name, result in results.items():
+        print(f"{name:<30} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+              f"{result['queries']:>8g} {result['peak_memory_kb']:>10.1f}  {','.join(map(str, result['status']))}")
+        if name in previous:
+            before = previous[name]
+            print(f"{'  vs baseline':<30} {change(result['p50_ms'], before['p50_ms']):>9} "
+                  f"{change(result['p95_ms'], before['p95_ms']):>9} {change(result['p99_ms'], before['p99_ms']):>9} "
+                  f"{change(result['queries'], before['queries']):>8} "
+                  f"{change(result['peak_memory_kb'], before['peak_memory_kb']):>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=1000, help='number of devices to seed')
+    parser.add_argument('--calibrations', type=int, default=10, help='calibrations per device')
+    parser.add_argument('--iterations', type=int, default=20, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed requests per scenario')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the dataset')
+    parser.add_argument('--only', help='run only scenarios whose name contains this text')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against results saved with --output')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline['dataset']['devices'], baseline['dataset']['calibrations']) != (args.devices, args.calibrations):
+            print('warning: baseline was recorded against a different dataset size', file=sys.stderr)
+
+    with tempfile.TemporaryDirectory(prefix='dashpy-bench-') as workdir:
+        app = build_app(workdir)
+        with app.app_context():
+            start = time.perf_counter()
+            seed(args.devices, args.calibrations, args.seed)
+            print(f'Seeded {args.devices} devices x {args.calibrations} calibrations '
+                  f'in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+            counter = QueryCounter(db.engines.values())
+
+        results = {}
+        client = app.test_client()
+        for name, request in SCENARIOS:
+            if args.only and args.only not in name:
+                continue
+            results[name] = run_scenario(client, counter, request, args.iterations, args.warmup)
+
+    report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'recorded_at': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'dataset': {'devices': args.devices, 'calibrations': args.calibrations, 'seed': args.seed},
+                'iterations': args.iterations,
+                'scenarios': results
+            }, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Cold-start benchmark: import time, app creation and first request
+
+Each run boots the application in a fresh interpreter, the way a new worker
+starts, and reports how long ``import app``, ``create_app()`` and the first
+request take, how many database connections were opened while booting
+and which heavy optional modules got imported. Results can be saved and
+compared like the endpoint benchmarks:
+
+    python -m benchmarks.startup --runs 10 --output startup.json
+    python -m benchmarks.startup --runs 10 --baseline startup.json
+
+The calsys bind keeps its configured URL; a healthy boot never connects to it.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that should only load on the paths that need them
+HEAVY_MODULES = ('openpyxl', 'pandas', 'numpy')
+
+METRICS = ('import_ms', 'create_app_ms', 'first_request_ms', 'boot_ms', 'connections')
+
+def probe(workdir):
+    """Boot the app once in this interpreter and print the measurements as JSON"""
+    sys.path.insert(0, ROOT)
+
+    start = time.perf_counter()
+    import app
+    imported = time.perf_counter()
+
+    from sqlalchemy import event
+    from sqlalchemy.pool import Pool
+    connections = []
+    event.listen(Pool, 'connect', lambda dbapi_connection, record: connections.append(record))
+
+    application = app.create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'database.db')}",
+        'EXPORT_SPOOL_DIR': os.path.join(workdir, 'exports')
+    })
+    created = time.perf_counter()
+
+    status = application.test_client().get('/').status_code
+    served = time.perf_counter()
+
+    print(json.dumps({
+        'import_ms': (imported - start) * 1000,
+        'create_app_ms': (created - imported) * 1000,
+        'first_request_ms': (served - created) * 1000,
+        'boot_ms': (served - start) * 1000,
+        'connections': len(connections),
+        'status': status,
+        'heavy_modules': [name for name in HEAVY_MODULES if name in sys.modules]
+    }))
+
+def run_once():
+    with tempfile.TemporaryDirectory(prefix='dashpy-startup-') as workdir:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.startup', '--probe', workdir],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(runs):
+    summary = {}
+    for metric in METRICS:
+        values = [run[metric] for run in runs]
+        summary[metric] = {
+            'median': round(statistics.median(values), 2),
+            'min': round(min(values), 2),
+            'max': round(max(values), 2)
+        }
+    summary['heavy_modules'] = sorted({name for run in runs for name in run['heavy_modules']})
+    summary['statuses'] = sorted({run['status'] for run in runs})
+    return summary
+
+def report(summary, baseline=None):
+    print(f"{'metric':<20}{'median':>10}{'min':>10}{'max':>10}")
+    for metric in METRICS:
+        values = summary[metric]
+        print(f"{metric:<20}{values['median']:>10.2f}{values['min']:>10.2f}{values['max']:>10.2f}")
+        previous = baseline and baseline.get(metric)
+        if previous and previous['median']:
+            change = (values['median'] - previous['median']) / previous['median'] * 100
+            print(f"  {'vs baseline':<18}{change:>+9.1f}%")
+    print(f"heavy modules loaded at boot: {', '.join(summary['heavy_modules']) or 'none'}")
+    print(f"first request status: {', '.join(map(str, summary['statuses']))}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='cold starts to measure')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against results saved with --output')
+    parser.add_argument('--probe', metavar='WORKDIR', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        probe(args.probe)
+        return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['summary']
+
+    runs = [run_once() for _ in range(args.runs)]
+    summary = summarize(runs)
+    report(summary, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'runs': args.runs,
+                'summary': summary
+            }, f, indent=2)
+
+if __name__ == '__main__':
+    main()
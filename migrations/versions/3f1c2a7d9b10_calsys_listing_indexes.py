@@ -0,0 +1,73 @@
+"""calsys listing indexes
+
+Revision ID: 3f1c2a7d9b10
+Revises: 
+Create Date: 2026-10-18 07:54:56.041970
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# Indexes behind the calsys listing filters, default sorts, the latest
+# calibration per device and the timeStamp high-water marks
+INDEXES = {
+    'calibration': {
+        'ix_calibration_deviceID': ['deviceID'],
+        'ix_calibration_calDate': ['calDate'],
+        'ix_calibration_calDue': ['calDue'],
+        'ix_calibration_status_calDate': ['status', 'calDate'],
+        'ix_calibration_employeeID_calDate': ['employeeID', 'calDate'],
+        'ix_calibration_timeStamp': ['timeStamp'],
+    },
+    'device': {
+        'ix_device_name': ['name'],
+        'ix_device_location_name': ['location', 'name'],
+        'ix_device_typeID_name': ['typeID', 'name'],
+        'ix_device_ownerID_name': ['ownerID', 'name'],
+        'ix_device_timeStamp': ['timeStamp'],
+    },
+}
+
+
+def existing_indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7d9b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name):
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name):
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_():
+    pass
+
+
+def downgrade_():
+    pass
+
+
+def upgrade_calsys():
+    # Databases created by `flask init-db` already have them
+    for table, indexes in INDEXES.items():
+        existing = existing_indexes(table)
+        for name, columns in indexes.items():
+            if name not in existing:
+                op.create_index(name, table, columns)
+
+
+def downgrade_calsys():
+    for table, indexes in INDEXES.items():
+        existing = existing_indexes(table)
+        for name in indexes:
+            if name in existing:
+                op.drop_index(name, table_name=table)
+
@@ -0,0 +1,57 @@
+"""latestCalibration table
+
+Revision ID: 8a4e6c1f2d37
+Revises: 3f1c2a7d9b10
+Create Date: 2026-10-18 09:12:03.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# Same grouping as the calibrationMaxID view it replaces
+FILL_LATEST = """
+    INSERT INTO latestCalibration (deviceID, calibrationID)
+    SELECT deviceID, MAX(ID) FROM calibration
+    WHERE deviceID IS NOT NULL
+    GROUP BY deviceID
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6c1f2d37'
+down_revision = '3f1c2a7d9b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name):
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name):
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_():
+    pass
+
+
+def downgrade_():
+    pass
+
+
+def upgrade_calsys():
+    # Databases created by `flask init-db` already have the table, though empty
+    if not sa.inspect(op.get_bind()).has_table('latestCalibration'):
+        op.create_table(
+            'latestCalibration',
+            sa.Column('deviceID', sa.String(length=15), nullable=False),
+            sa.Column('calibrationID', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('deviceID')
+        )
+        op.create_index('ix_latestCalibration_calibrationID', 'latestCalibration', ['calibrationID'], unique=True)
+    op.execute('DELETE FROM latestCalibration')
+    op.execute(FILL_LATEST)
+
+
+def downgrade_calsys():
+    op.drop_table('latestCalibration')
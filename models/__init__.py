@@ -1,12 +1,16 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from .replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 
 # Import all models here
 from .auth import User, UserSettings
 from .calsys import *  # Import all calsys models
+from .snapshot import CalibrationDueSnapshot, SnapshotState
+from .latest_calibration import track_calibration_writes  # registers the flush hook
+from .search import SearchIndexState
 # Import your other database models here
 # from .database1 import *
 # from .database2 import *
@@ -2,6 +2,7 @@ from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from . import db
+import hashlib
 
 class User(UserMixin, db.Model):
     """Model for user accounts"""
@@ -18,6 +19,14 @@ class User(UserMixin, db.Model):
         
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
+    
+    @property
+    def session_stamp(self):
+        """Changes with the password, so a password change ends existing sessions"""
+        return hashlib.sha256(self.password_hash.encode()).hexdigest()[:12]
+    
+    def get_id(self):
+        return f'{self.id}:{self.session_stamp}'
         
     def to_dict(self):
         return {
@@ -40,6 +49,18 @@ class UserSettings(db.Model):
     
     user = db.relationship('User', backref=db.backref('settings', uselist=False))
     
+    @classmethod
+    def defaults(cls, user_id):
+        """Settings for a user who has never saved any, without creating a row"""
+        return {
+            'id': None,
+            'user_id': user_id,
+            'theme': cls.theme.default.arg,
+            'items_per_page': cls.items_per_page.default.arg,
+            'created_at': None,
+            'updated_at': None
+        }
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -0,0 +1,97 @@
+from flask import current_app
+from sqlalchemy import func
+from . import db
+from .calsys import (
+    Employee, Location, Owner, Period, Source, Status, Type, CalibratedBy
+)
+import threading
+import time
+
+# Small, rarely edited tables that are safe to hold in memory
+REFERENCE_MODELS = (Location, Type, Owner, Source, Period, Status, Employee, CalibratedBy)
+
+class CacheEntry:
+    """Cached rows of one reference table and the version they were read at"""
+
+    def __init__(self, version, rows, checked_at):
+        self.version = version
+        self.rows = rows
+        self.names = {row['ID']: row['name'] for row in rows}
+        self.checked_at = checked_at
+
+class ReferenceCache:
+    """In-process cache of the calsys reference tables
+
+    Entries are revalidated once ``REFERENCE_CACHE_TTL`` seconds have passed
+    by comparing the table's max ``updated_at`` and row count, and reloaded
+    only when those changed. Tables larger than ``REFERENCE_CACHE_MAX_ROWS``
+    are not cached and callers fall back to querying the database.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def version(self, model):
+        """Cheap validator for a table's contents"""
+        return tuple(db.session.execute(
+            db.select(func.max(model.updated_at), func.count()).select_from(model)
+        ).one())
+
+    def entry(self, model):
+        if model not in REFERENCE_MODELS:
+            return None
+
+        now = time.monotonic()
+        entry = self.entries.get(model)
+        if entry is not None and now - entry.checked_at < current_app.config.get('REFERENCE_CACHE_TTL', 300):
+            return entry
+
+        version = self.version(model)
+        if entry is not None and entry.version == version:
+            entry.checked_at = now
+            return entry
+
+        if version[1] > current_app.config.get('REFERENCE_CACHE_MAX_ROWS', 10000):
+            with self.lock:
+                self.entries.pop(model, None)
+            return None
+
+        entry = CacheEntry(version, [item.to_dict() for item in model.query.all()], now)
+        with self.lock:
+            self.entries[model] = entry
+        return entry
+
+    def rows(self, model):
+        """All rows of a reference table as dicts, or None if not cacheable"""
+        entry = self.entry(model)
+        return entry.rows if entry is not None else None
+
+    def names(self, model):
+        """Mapping of ID to name for a reference table, or None if not cacheable"""
+        entry = self.entry(model)
+        return entry.names if entry is not None else None
+
+    def invalidate(self, model=None):
+        """Drop one table, or every table, from the cache"""
+        with self.lock:
+            if model is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(model, None)
+
+reference_cache = ReferenceCache()
+
+def version_column(model):
+    """Column that moves forward whenever a row of the table changes"""
+    return model.timeStamp if hasattr(model, 'timeStamp') else model.updated_at
+
+def table_versions(*models):
+    """Max change timestamp and row count of each table, in one round-trip"""
+    columns = []
+    for model in models:
+        columns.append(db.select(func.max(version_column(model))).scalar_subquery())
+        columns.append(db.select(func.count()).select_from(model).scalar_subquery())
+    return tuple(db.session.execute(
+        db.select(*columns), bind_arguments={'mapper': models[0]}
+    ).one())
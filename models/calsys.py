@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import or_
 from . import db
 from .base import BaseModel
 
@@ -18,6 +19,17 @@ class Calibration(BaseModel):
     """Record of all calibrations performed"""
     __tablename__ = 'calibration'
     __bind_key__ = 'calsys'
+    __table_args__ = (
+        # Secondary indexes also hold the primary key, so (deviceID) serves
+        # the latest calibration's MAX(ID) per device and (calDate) keyset pages
+        db.Index('ix_calibration_deviceID', 'deviceID'),
+        db.Index('ix_calibration_calDate', 'calDate'),
+        db.Index('ix_calibration_calDue', 'calDue'),
+        db.Index('ix_calibration_status_calDate', 'status', 'calDate'),
+        db.Index('ix_calibration_employeeID_calDate', 'employeeID', 'calDate'),
+        # High-water marks of the due snapshot and replica lag checks
+        db.Index('ix_calibration_timeStamp', 'timeStamp'),
+    )
     
     ID = db.Column(db.Integer, primary_key=True, autoincrement=True)
     deviceID = db.Column(db.String(15), db.ForeignKey('device.ID'))
@@ -36,6 +48,14 @@ class Device(BaseModel):
     """All calibrated devices"""
     __tablename__ = 'device'
     __bind_key__ = 'calsys'
+    __table_args__ = (
+        # Listing filters, each followed by the default name sort
+        db.Index('ix_device_name', 'name'),
+        db.Index('ix_device_location_name', 'location', 'name'),
+        db.Index('ix_device_typeID_name', 'typeID', 'name'),
+        db.Index('ix_device_ownerID_name', 'ownerID', 'name'),
+        db.Index('ix_device_timeStamp', 'timeStamp'),
+    )
     
     ID = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(50), comment='Name for device')
@@ -57,6 +77,22 @@ class Device(BaseModel):
     device_location = db.relationship('Location', backref='devices')
     calibration_period = db.relationship('Period', backref='devices')
 
+class LatestCalibration(db.Model):
+    """Latest calibration of each device, maintained in place of the calibrationMaxID view
+
+    Kept current by ``models.latest_calibration``; one row per device, so
+    joins through it are sized by the device count rather than the history.
+    """
+    __tablename__ = 'latestCalibration'
+    __bind_key__ = 'calsys'
+    __table_args__ = (
+        # A calibration is the latest of at most one device; joins from calibration probe it
+        db.Index('ix_latestCalibration_calibrationID', 'calibrationID', unique=True),
+    )
+    
+    deviceID = db.Column(db.String(15), primary_key=True)
+    calibrationID = db.Column(db.Integer, nullable=False)
+
 class Employee(BaseModel):
     """Employees assigned to devices or that calibrate devices"""
     __tablename__ = 'employee'
@@ -119,28 +155,40 @@ class Type(BaseModel):
     procLink = db.Column(db.String(255), comment='Hyper link to calibration procedures for device types')
 
 # Helper methods for views
-def get_calibration_due(db_session):
+def get_calibration_due(db_session, execution_options=None):
     """Recreate the calibrationDue view using SQLAlchemy"""
     from sqlalchemy import text
     return db_session.execute(text("""
-        SELECT c.ID, cm.deviceID, cm.name, cm.description, cm.typeID, 
-               cm.location, c.status, c.calDate, c.calDue, cm.period
-        FROM calibrationMaxID cm
-        JOIN calibration c ON c.ID = cm.ID
+        SELECT c.ID, lc.deviceID, d.name, d.description, d.typeID, 
+               d.location, c.status, c.calDate, c.calDue, d.period
+        FROM latestCalibration lc
+        JOIN calibration c ON c.ID = lc.calibrationID
+        JOIN device d ON d.ID = lc.deviceID
         WHERE c.calDue > 0
         ORDER BY c.calDue
-    """))
+    """), execution_options=execution_options or {}, bind_arguments={'mapper': Calibration})
 
-def get_cal_export(db_session):
-    """Recreate the calExport view using SQLAlchemy"""
-    from sqlalchemy import text
-    return db_session.execute(text("""
-        SELECT d.location, d.name, c.ID, e.userInit, c.employeeID,
-               c.calDate, c.calDue, c.status
-        FROM calibrationMaxID cm
-        JOIN calibration c ON c.ID = cm.ID
-        JOIN employee e ON e.ID = c.employeeID
-        JOIN device d ON d.ID = c.deviceID
-        WHERE c.status = 'Active' OR c.status = 'CalInv'
-        ORDER BY d.location, d.name, c.ID
-    """))
+def cal_export_select():
+    """The calExport view as a select, so filters and paging can be added to it"""
+    return (
+        db.select(
+            Device.location, Device.name, Calibration.ID, Employee.userInit,
+            Calibration.employeeID, Calibration.calDate, Calibration.calDue, Calibration.status
+        )
+        .select_from(LatestCalibration)
+        .join(Calibration, Calibration.ID == LatestCalibration.calibrationID)
+        .join(Employee, Employee.ID == Calibration.employeeID)
+        .join(Device, Device.ID == Calibration.deviceID)
+        .where(or_(Calibration.status == 'Active', Calibration.status == 'CalInv'))
+        .order_by(Device.location, Device.name, Calibration.ID)
+    )
+
+def get_cal_export(db_session, stmt=None, execution_options=None):
+    """Recreate the calExport view using SQLAlchemy
+
+    ``stmt`` is a filtered or paged ``cal_export_select()``; the whole
+    view is returned by default.
+    """
+    if stmt is None:
+        stmt = cal_export_select()
+    return db_session.execute(stmt, execution_options=execution_options or {}, bind_arguments={'mapper': Calibration})
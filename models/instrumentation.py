@@ -0,0 +1,86 @@
+from flask import g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from . import db
+import json
+import logging
+import time
+
+slow_query_logger = logging.getLogger('dashpy.sql.slow')
+
+class RequestSQLStats:
+    """Query count, total time and slowest statement per bind for one request"""
+
+    def __init__(self):
+        self.binds = {}
+
+    def record(self, bind, duration, statement):
+        stats = self.binds.setdefault(bind, {'count': 0, 'total': 0.0, 'slowest': 0.0, 'statement': None})
+        stats['count'] += 1
+        stats['total'] += duration
+        if duration > stats['slowest']:
+            stats['slowest'] = duration
+            stats['statement'] = statement
+
+    def server_timing(self):
+        """Server-Timing entries, one per bind plus the slowest statement"""
+        entries = []
+        slowest = None
+        for bind, stats in self.binds.items():
+            entries.append(f'db-{bind};dur={stats["total"] * 1000:.2f};desc="{stats["count"]} queries"')
+            if slowest is None or stats['slowest'] > slowest[1]:
+                slowest = (bind, stats['slowest'])
+        if slowest is not None:
+            entries.append(f'db-slowest;dur={slowest[1] * 1000:.2f};desc="{slowest[0]}"')
+        return ', '.join(entries)
+
+def init_sql_instrumentation(app):
+    """Time every statement per request when ``SQL_INSTRUMENTATION`` is on
+
+    Nothing is registered when it is off, so there is no per-query cost.
+    Statements slower than ``SQL_SLOW_QUERY_MS`` are logged as JSON to
+    the ``dashpy.sql.slow`` logger.
+    """
+    if not app.config.get('SQL_INSTRUMENTATION'):
+        return
+
+    threshold = app.config.get('SQL_SLOW_QUERY_MS', 200) / 1000
+
+    def listen(engine, bind):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            duration = time.perf_counter() - conn.info['query_start'].pop()
+            stats = g.get('sql_stats') if has_app_context() else None
+            if stats is not None:
+                stats.record(bind, duration, statement)
+            if duration >= threshold:
+                slow_query_logger.warning(json.dumps({
+                    'bind': bind,
+                    'duration_ms': round(duration * 1000, 2),
+                    'path': request.path if has_request_context() else None,
+                    'statement': statement
+                }))
+
+        @event.listens_for(engine, 'handle_error')
+        def handle_error(context):
+            # Failed statements never reach after_cursor_execute
+            if context.connection is not None and context.connection.info.get('query_start'):
+                context.connection.info['query_start'].pop()
+
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            listen(engine, bind_key or 'default')
+
+    @app.before_request
+    def start_sql_stats():
+        g.sql_stats = RequestSQLStats()
+
+    @app.after_request
+    def add_server_timing(response):
+        stats = g.get('sql_stats')
+        if stats is not None and stats.binds:
+            response.headers.add('Server-Timing', stats.server_timing())
+        return response
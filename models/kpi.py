@@ -0,0 +1,99 @@
+from datetime import date, timedelta
+from flask import current_app
+from sqlalchemy import Date, and_, case, func, literal, literal_column
+from . import db
+from .calsys import Calibration, Device
+import threading
+import time
+
+# Group-by dimensions, by the name callers use
+KPI_DIMENSIONS = {
+    'location': Device.location,
+    'typeID': Device.typeID,
+    'ownerID': Device.ownerID,
+    'period': Device.period,
+    'status': Calibration.status
+}
+
+DEFAULT_BUCKETS = (30, 60, 90)
+MAX_BUCKETS = 10
+
+def bucket_labels(buckets):
+    """Labels of the due-date ranges, e.g. 0-30, 30-60 and 60-90 days"""
+    bounds = (0,) + tuple(buckets)
+    return [f'{start}-{end}' for start, end in zip(bounds, bounds[1:])]
+
+def calibration_kpis(dimensions, buckets, today=None):
+    """Device counts per group by the due date of their latest calibration
+
+    Every group reports its total, how many are overdue, how many fall
+    in each ``[start, end)`` day range from ``today``, and how many are
+    due later than the last bucket.
+    """
+    today = today or date.today()
+    due = Calibration.calDue
+
+    def on_or_after(days):
+        return due >= literal(today + timedelta(days=days), Date)
+
+    def before(days):
+        return due < literal(today + timedelta(days=days), Date)
+
+    def count_where(condition):
+        return func.sum(case((condition, 1), else_=0))
+
+    bounds = (0,) + tuple(buckets)
+    columns = [KPI_DIMENSIONS[name].label(name) for name in dimensions]
+    columns.append(func.count().label('total'))
+    columns.append(count_where(before(0)).label('overdue'))
+    for label, start, end in zip(bucket_labels(buckets), bounds, bounds[1:]):
+        columns.append(count_where(and_(on_or_after(start), before(end))).label(label))
+    columns.append(count_where(on_or_after(bounds[-1])).label('later'))
+
+    latest_ids = db.select(func.max(Calibration.ID)).group_by(Calibration.deviceID)
+    stmt = (
+        db.select(*columns)
+        .select_from(Calibration)
+        .join(Device, Device.ID == Calibration.deviceID)
+        .where(Calibration.ID.in_(latest_ids))
+        .where(due > literal_column('0'))
+    )
+    if dimensions:
+        group = [KPI_DIMENSIONS[name] for name in dimensions]
+        stmt = stmt.group_by(*group).order_by(*group)
+
+    labels = bucket_labels(buckets)
+    groups = []
+    for row in db.session.execute(stmt):
+        values = row._mapping
+        groups.append({
+            **{name: values[name] for name in dimensions},
+            'total': values['total'],
+            'overdue': values['overdue'] or 0,
+            'due': {label: values[label] or 0 for label in labels},
+            'later': values['later'] or 0
+        })
+    return groups
+
+class KpiCache:
+    """Aggregates kept for ``KPI_CACHE_TTL`` seconds, keyed by their parameters"""
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            # Drop whatever else has expired so the cache stays small
+            self.entries = {k: v for k, v in self.entries.items() if v[0] > now}
+
+        value = compute()
+        with self.lock:
+            self.entries[key] = (now + current_app.config.get('KPI_CACHE_TTL', 60), value)
+        return value
+
+kpi_cache = KpiCache()
@@ -0,0 +1,158 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.exc import SQLAlchemyError
+from . import db
+from .calsys import Calibration, LatestCalibration
+from .replicas import PRIMARY_BIND, RoutingSession
+from .snapshot import SnapshotState, changed_since
+import itertools
+import threading
+
+# Device IDs recomputed per statement during a sync
+SYNC_CHUNK_SIZE = 500
+
+STATE_NAME = 'latest_calibration'
+
+latest_table = LatestCalibration.__table__
+
+sync_lock = threading.Lock()
+
+def primary_connection(session=None):
+    """Connection to the calsys primary, which holds the table even when reads use a replica"""
+    session = session or db.session
+    return session.connection(bind_arguments={'bind': db.engines[PRIMARY_BIND]})
+
+def latest_ids_select(device_ids=None):
+    """(deviceID, latest calibration ID) per device, read from the calibration table"""
+    stmt = (
+        select(Calibration.deviceID, func.max(Calibration.ID).label('calibrationID'))
+        .where(Calibration.deviceID.is_not(None))
+        .group_by(Calibration.deviceID)
+    )
+    if device_ids is not None:
+        stmt = stmt.where(Calibration.deviceID.in_(device_ids))
+    return stmt
+
+def update_latest_calibrations(device_ids, session=None):
+    """Recompute the latest calibration of ``device_ids``, returning how many changed
+
+    ORM flushes call this themselves; call it after writing calibrations
+    with bulk statements. Nothing is committed.
+    """
+    connection = primary_connection(session)
+    device_ids = sorted({str(device_id) for device_id in device_ids if device_id is not None})
+
+    changes = 0
+    for start in range(0, len(device_ids), SYNC_CHUNK_SIZE):
+        chunk = device_ids[start:start + SYNC_CHUNK_SIZE]
+        current = dict(connection.execute(latest_ids_select(chunk)).all())
+        existing = dict(connection.execute(
+            select(latest_table.c.deviceID, latest_table.c.calibrationID)
+            .where(latest_table.c.deviceID.in_(chunk))
+        ).all())
+        stale = [device_id for device_id in chunk if current.get(device_id) != existing.get(device_id)]
+        if not stale:
+            continue
+
+        changes += len(stale)
+        connection.execute(latest_table.delete().where(latest_table.c.deviceID.in_(stale)))
+        rows = [{'deviceID': device_id, 'calibrationID': current[device_id]}
+                for device_id in stale if device_id in current]
+        if rows:
+            connection.execute(latest_table.insert(), rows)
+    return changes
+
+@event.listens_for(RoutingSession, 'after_flush')
+def track_calibration_writes(session, flush_context):
+    """Update the devices whose calibrations were added, deleted or moved in this flush"""
+    device_ids = set()
+    for instance in itertools.chain(session.new, session.deleted):
+        if isinstance(instance, Calibration):
+            device_ids.add(inspect(instance).dict.get('deviceID'))
+    for instance in session.dirty:
+        if isinstance(instance, Calibration):
+            history = inspect(instance).attrs.deviceID.history
+            device_ids.update([*history.added, *history.deleted])
+    device_ids.discard(None)
+    if device_ids:
+        update_latest_calibrations(device_ids, session)
+
+def sync_latest_calibrations(state):
+    """Recompute the devices whose calibrations changed since the last sync
+
+    Catches writes made outside this application. Rows stamped at the
+    previous high-water mark are read again, since writes can land within
+    the same second after the last sync; with no high-water mark every
+    device is checked. Deleted calibrations are only picked up by a
+    rebuild.
+    """
+    with sync_lock:
+        connection = primary_connection()
+        high_water = connection.execute(select(func.max(Calibration.timeStamp))).scalar()
+        device_ids = connection.execute(
+            select(Calibration.deviceID).distinct()
+            .where(changed_since(Calibration.timeStamp, state.calibration_high_water))
+        ).scalars().all()
+
+        changes = update_latest_calibrations(device_ids)
+        if changes:
+            state.version = (state.version or 0) + 1
+        state.calibration_high_water = high_water or state.calibration_high_water
+        state.refreshed_at = datetime.utcnow()
+        db.session.add(state)
+        db.session.commit()
+        return changes
+
+def rebuild_latest_calibrations():
+    """Replace the whole table with the latest calibration of every device"""
+    with sync_lock:
+        connection = primary_connection()
+        high_water = connection.execute(select(func.max(Calibration.timeStamp))).scalar()
+        connection.execute(latest_table.delete())
+        connection.execute(latest_table.insert().from_select(['deviceID', 'calibrationID'], latest_ids_select()))
+        count = connection.execute(select(func.count()).select_from(latest_table)).scalar()
+
+        now = datetime.utcnow()
+        state = db.session.get(SnapshotState, STATE_NAME) or SnapshotState(name=STATE_NAME)
+        state.calibration_high_water = high_water
+        state.refreshed_at = now
+        state.rebuilt_at = now
+        state.version = (state.version or 0) + 1
+        db.session.add(state)
+        db.session.commit()
+        return count
+
+def latest_calibrations():
+    """Return the sync state, syncing first if it is older than the interval
+
+    A failed sync is logged and the table is read as is.
+    """
+    state = db.session.get(SnapshotState, STATE_NAME)
+    interval = current_app.config.get('LATEST_CALIBRATION_SYNC_INTERVAL', 60)
+    if state is not None and (datetime.utcnow() - state.refreshed_at).total_seconds() < interval:
+        return state
+
+    try:
+        sync_latest_calibrations(state or SnapshotState(name=STATE_NAME))
+    except SQLAlchemyError:
+        db.session.rollback()
+        current_app.logger.exception('Latest calibration sync failed')
+    return db.session.get(SnapshotState, STATE_NAME)
+
+def check_latest_calibrations():
+    """Compare the table with the calibration table
+
+    Returns the device IDs with no row (``missing``), pointing at another
+    calibration than their latest (``stale``) and with a row but no
+    calibrations left (``extra``).
+    """
+    connection = primary_connection()
+    expected = dict(connection.execute(latest_ids_select()).all())
+    actual = dict(connection.execute(select(latest_table.c.deviceID, latest_table.c.calibrationID)).all())
+    return {
+        'missing': sorted(expected.keys() - actual.keys()),
+        'stale': sorted(device_id for device_id in expected.keys() & actual.keys()
+                        if expected[device_id] != actual[device_id]),
+        'extra': sorted(actual.keys() - expected.keys())
+    }
@@ -0,0 +1,132 @@
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+import os
+import threading
+import time
+
+# Environment suffixes for per-bind pool settings, e.g. CALSYS_POOL_SIZE
+POOL_SETTINGS = {
+    'POOL_SIZE': ('pool_size', int),
+    'MAX_OVERFLOW': ('max_overflow', int),
+    'POOL_RECYCLE': ('pool_recycle', int),
+    'POOL_TIMEOUT': ('pool_timeout', float),
+    'POOL_PRE_PING': ('pool_pre_ping', lambda value: value.lower() in ('1', 'true', 'yes', 'on')),
+}
+
+class PoolMetrics:
+    """Counters for connection checkouts from one bind's pool"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited, timed_out=False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_total_ms': round(self.wait_total * 1000, 3),
+                'wait_avg_ms': round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3)
+            }
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that times how long each checkout waits for a connection
+
+    Subclasses made by ``metered_pool`` carry their own ``metrics``, which
+    survive ``engine.dispose()`` since the pool is recreated from its class.
+    """
+    metrics = None
+    reentry = threading.local()
+
+    def _do_get(self):
+        # QueuePool._do_get retries by calling itself; only time the outer call
+        if getattr(self.reentry, 'active', False):
+            return super()._do_get()
+
+        self.reentry.active = True
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        finally:
+            self.reentry.active = False
+        self.metrics.record(time.perf_counter() - start)
+        return connection
+
+pool_metrics = {}
+
+def metered_pool(bind_key):
+    """Pool class that reports into the metrics for ``bind_key``"""
+    metrics = pool_metrics.setdefault(bind_key, PoolMetrics())
+    return type(f'MeteredQueuePool_{bind_key or "default"}', (MeteredQueuePool,), {'metrics': metrics})
+
+def engine_options(prefix, bind_key, **defaults):
+    """Engine options for a bind, overridable from ``<prefix>_POOL_*`` env vars"""
+    options = dict(defaults)
+    for suffix, (option, convert) in POOL_SETTINGS.items():
+        value = os.getenv(f'{prefix}_{suffix}')
+        if value:
+            options[option] = convert(value)
+    options['poolclass'] = metered_pool(bind_key)
+    return options
+
+def pool_status(engines):
+    """Current pool occupancy and checkout wait metrics for each bind"""
+    status = {}
+    for bind_key, engine in engines.items():
+        pool = engine.pool
+        entry = {'pool': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            entry.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'idle': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+                'max_overflow': pool._max_overflow
+            })
+        if isinstance(pool, MeteredQueuePool):
+            entry.update(pool.metrics.to_dict())
+        status[bind_key or 'default'] = entry
+    return status
+
+def sqlite_pragmas(busy_timeout_ms):
+    """Pragmas for SQLite connections: WAL so readers never wait on a writer,
+    a busy timeout instead of immediate ``database is locked`` errors, and
+    NORMAL sync, which is durable enough for WAL on local settings
+    """
+    return (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA busy_timeout={int(busy_timeout_ms)}',
+        'PRAGMA temp_store=MEMORY'
+    )
+
+def init_sqlite_pragmas(app, engines):
+    """Apply ``sqlite_pragmas`` to every new connection of the SQLite binds"""
+    pragmas = sqlite_pragmas(app.config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    for engine in engines.values():
+        if engine.dialect.name != 'sqlite':
+            continue
+
+        @event.listens_for(engine, 'connect')
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
@@ -0,0 +1,112 @@
+from datetime import datetime
+from sqlalchemy.orm import aliased
+from . import db
+from .cache import reference_cache
+from .calsys import (
+    Device, Calibration, Employee, Location, Owner,
+    Source, Status, Type, CalibratedBy
+)
+
+# Related lookup names added to each listing row, keyed by output field:
+# field name -> (foreign key column on the listed model, referenced model)
+DEVICE_RELATIONS = {
+    'type_name': (Device.typeID, Type),
+    'location_name': (Device.location, Location),
+    'owner_name': (Device.ownerID, Owner),
+    'source_name': (Device.sourceID, Source),
+}
+
+CALIBRATION_RELATIONS = {
+    'device_name': (Calibration.deviceID, Device),
+    'calibrated_by_name': (Calibration.calibratedByID, CalibratedBy),
+    'employee_name': (Calibration.employeeID, Employee),
+    'status_name': (Calibration.status, Status),
+}
+
+class RowSerializer:
+    """Serializes Core rows of a model's table columns like ``BaseModel.to_dict``
+
+    Which columns need converting is worked out once per model from the
+    column types, so rows skip ORM hydration and per-value type checks.
+    """
+
+    def __init__(self, model):
+        self.columns = tuple(model.__table__.columns)
+        self.keys = tuple(column.name for column in self.columns)
+        self.datetime_indexes = tuple(
+            index for index, column in enumerate(self.columns)
+            if column_python_type(column) is datetime
+        )
+
+    def values(self, row):
+        """Row values as a list, datetimes as ISO strings"""
+        values = list(row)
+        for index in self.datetime_indexes:
+            value = values[index]
+            if value is not None:
+                values[index] = value.isoformat()
+        return values
+
+    def to_dict(self, row):
+        return dict(zip(self.keys, self.values(row)))
+
+    def dicts(self, rows):
+        return [self.to_dict(row) for row in rows]
+
+def column_python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+serializers = {}
+
+def row_serializer(model):
+    """The shared ``RowSerializer`` of a model, built on first use"""
+    serializer = serializers.get(model)
+    if serializer is None:
+        serializer = serializers[model] = RowSerializer(model)
+    return serializer
+
+def related_names(model, ids, relations):
+    """Fetch the related lookup names for a set of rows in a single joined query"""
+    if not ids:
+        return {}
+
+    stmt = db.select(model.ID).select_from(model)
+    for field, (fk_column, target) in relations.items():
+        target_alias = aliased(target)
+        stmt = stmt.outerjoin(target_alias, target_alias.ID == fk_column)
+        stmt = stmt.add_columns(target_alias.name.label(field))
+    stmt = stmt.where(model.ID.in_(ids))
+
+    return {
+        row.ID: {field: getattr(row, field) for field in relations}
+        for row in db.session.execute(stmt)
+    }
+
+def enrich_items(model, items, relations):
+    """Add related lookup names to serialized rows of a listing page
+    
+    Names of cached reference tables are resolved in memory; only the
+    remaining relations go to the database, in one joined query.
+    """
+    if not items:
+        return items
+    
+    cached = {}
+    joined = {}
+    for field, (fk_column, target) in relations.items():
+        target_names = reference_cache.names(target)
+        if target_names is None:
+            joined[field] = (fk_column, target)
+        else:
+            cached[field] = (fk_column.key, target_names)
+    
+    names = related_names(model, [item['ID'] for item in items], joined) if joined else {}
+    empty = dict.fromkeys(joined)
+    return [{
+        **item,
+        **{field: target_names.get(item[key]) for field, (key, target_names) in cached.items()},
+        **names.get(item['ID'], empty)
+    } for item in items]
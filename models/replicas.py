@@ -0,0 +1,249 @@
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import InterfaceError, OperationalError, SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+from .pool import metered_pool
+import itertools
+import threading
+import time
+
+# The bind whose reads can be served by replicas
+PRIMARY_BIND = 'calsys'
+
+# Requests with these methods only read, so their calsys queries may use a replica
+READ_METHODS = ('GET', 'HEAD')
+
+# Session.info keys: opt-in outside GET requests, and the bind chosen for the session
+USE_REPLICAS = 'use_replicas'
+CHOSEN_BIND = 'calsys_read_bind'
+
+class Replica:
+    """One replica bind: how far it trails the primary and whether it is benched"""
+
+    def __init__(self, bind_key, url):
+        self.bind_key = bind_key
+        self.url = make_url(url).render_as_string(hide_password=True)
+        self.lag = None
+        self.checked_at = None
+        self.down_until = 0.0
+        self.error = None
+
+    def to_dict(self, now):
+        return {
+            'url': self.url,
+            'lag_seconds': self.lag,
+            'checked_seconds_ago': round(now - self.checked_at, 1) if self.checked_at is not None else None,
+            'down': self.down_until > now,
+            'error': self.error
+        }
+
+class ReplicaRouter:
+    """Sends calsys reads to replicas, keeping writes on the primary
+
+    ``CALSYS_REPLICA_URLS`` adds a ``calsys_replica_<n>`` bind per replica.
+    Sessions of GET and HEAD requests, and those marked with
+    ``use_replicas`` (export jobs, dashboard sections), read calsys from a
+    replica picked round-robin or, with ``CALSYS_REPLICA_STRATEGY`` set to
+    ``least-load``, by fewest checked-out connections; the session keeps it
+    until it ends. Flushes always go to the primary.
+
+    Lag is how far the newest calibration and device ``timeStamp`` on a
+    replica trails the primary's, checked every
+    ``CALSYS_REPLICA_LAG_CHECK_INTERVAL`` seconds; replicas more than
+    ``CALSYS_REPLICA_MAX_LAG`` seconds behind are skipped. A replica that
+    fails to connect or errors is benched for
+    ``CALSYS_REPLICA_RETRY_INTERVAL`` seconds and the statement retried on
+    the primary.
+    """
+
+    def __init__(self):
+        self.replicas = {}
+        self.lock = threading.Lock()
+        self.checking = False
+        self.turn = itertools.count()
+        self.failures = threading.local()
+
+    def init_app(self, app):
+        """Add a bind per replica URL; call before ``db.init_app``"""
+        app.config.setdefault('CALSYS_REPLICA_URLS', [])
+        app.config.setdefault('CALSYS_REPLICA_STRATEGY', 'round-robin')
+        app.config.setdefault('CALSYS_REPLICA_MAX_LAG', 30)
+        app.config.setdefault('CALSYS_REPLICA_LAG_CHECK_INTERVAL', 5)
+        app.config.setdefault('CALSYS_REPLICA_RETRY_INTERVAL', 30)
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        primary = binds.get(PRIMARY_BIND)
+        # Replicas share the primary's pool settings
+        options = dict(primary) if isinstance(primary, dict) else {}
+        self.replicas = {}
+        for number, url in enumerate(app.config['CALSYS_REPLICA_URLS'], 1):
+            bind_key = f'{PRIMARY_BIND}_replica_{number}'
+            replica_options = {**options, 'url': url}
+            if 'poolclass' in options:
+                replica_options['poolclass'] = metered_pool(bind_key)
+            binds[bind_key] = replica_options
+            self.replicas[bind_key] = Replica(bind_key, url)
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.extensions['replica_router'] = self
+
+    def init_engines(self, engines):
+        """Bench a replica as soon as one of its connections or statements fails"""
+        for bind_key in self.replicas:
+            self.listen(engines[bind_key], bind_key)
+
+    def listen(self, engine, bind_key):
+        @event.listens_for(engine, 'handle_error')
+        def replica_error(context):
+            if context.is_disconnect or isinstance(context.sqlalchemy_exception, (OperationalError, InterfaceError)):
+                self.failed(bind_key, context.original_exception)
+                self.failures.bind_key = bind_key
+
+    def failed(self, bind_key, error):
+        replica = self.replicas[bind_key]
+        replica.down_until = time.monotonic() + current_app.config['CALSYS_REPLICA_RETRY_INTERVAL']
+        replica.error = str(error)
+        current_app.logger.warning('Replica %s failed, reading from the primary: %s', bind_key, error)
+
+    def take_failure(self):
+        """The replica whose failure interrupted the last statement on this thread"""
+        bind_key = getattr(self.failures, 'bind_key', None)
+        self.failures.bind_key = None
+        return bind_key
+
+    def high_water_marks(self, engine):
+        from .calsys import Calibration, Device
+        with engine.connect() as connection:
+            return [
+                connection.execute(select(func.max(column))).scalar()
+                for column in (Calibration.timeStamp, Device.timeStamp)
+            ]
+
+    def check_lag(self, engines, now):
+        """Measure the lag of replicas not checked within the interval
+
+        One thread measures at a time; the others route on the last result.
+        """
+        interval = current_app.config['CALSYS_REPLICA_LAG_CHECK_INTERVAL']
+        with self.lock:
+            due = [
+                replica for replica in self.replicas.values()
+                if replica.down_until <= now and (replica.checked_at is None or now - replica.checked_at >= interval)
+            ]
+            if not due or self.checking:
+                return
+            self.checking = True
+
+        try:
+            try:
+                primary = self.high_water_marks(engines[PRIMARY_BIND])
+            except SQLAlchemyError:
+                current_app.logger.exception('Measuring replica lag failed on the primary')
+                for replica in due:
+                    replica.checked_at = now
+                return
+
+            for replica in due:
+                try:
+                    marks = self.high_water_marks(engines[replica.bind_key])
+                except SQLAlchemyError as error:
+                    # Connection errors are already benched by the handle_error hook
+                    if self.take_failure() is None:
+                        self.failed(replica.bind_key, error)
+                    continue
+                finally:
+                    replica.checked_at = now
+                replica.lag = replication_lag(primary, marks)
+                replica.error = None
+        finally:
+            with self.lock:
+                self.checking = False
+
+    def choose(self, engines):
+        """Bind key of the replica to read from, or the primary if none is usable"""
+        if not self.replicas:
+            return PRIMARY_BIND
+        now = time.monotonic()
+        self.check_lag(engines, now)
+
+        max_lag = current_app.config['CALSYS_REPLICA_MAX_LAG']
+        usable = [
+            replica.bind_key for replica in self.replicas.values()
+            if replica.down_until <= now and replica.lag is not None and replica.lag <= max_lag
+        ]
+        if not usable:
+            return PRIMARY_BIND
+
+        # Rotate the starting point so ties spread across replicas too
+        start = next(self.turn) % len(usable)
+        usable = usable[start:] + usable[:start]
+        if current_app.config['CALSYS_REPLICA_STRATEGY'] == 'least-load':
+            return min(usable, key=lambda bind_key: checked_out(engines[bind_key]))
+        return usable[0]
+
+    def status(self):
+        now = time.monotonic()
+        return {bind_key: replica.to_dict(now) for bind_key, replica in self.replicas.items()}
+
+replica_router = ReplicaRouter()
+
+def replication_lag(primary, replica):
+    """Seconds the replica's newest changes trail the primary's, per watched column"""
+    lag = 0.0
+    for primary_mark, replica_mark in zip(primary, replica):
+        if primary_mark is None:
+            continue
+        if replica_mark is None:
+            return float('inf')
+        lag = max(lag, (primary_mark - replica_mark).total_seconds())
+    return lag
+
+def checked_out(engine):
+    return engine.pool.checkedout() if isinstance(engine.pool, QueuePool) else 0
+
+def use_replicas(session):
+    """Let a session outside a GET request read calsys from a replica"""
+    session.info[USE_REPLICAS] = True
+
+class RoutingSession(Session):
+    """Session that reads calsys from a replica when ``replica_router`` allows it"""
+
+    def reads_from_replicas(self):
+        if self.info.get(USE_REPLICAS):
+            return True
+        return has_request_context() and request.method in READ_METHODS
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        engines = self._db.engines
+        if bind is not None or self._flushing or engine is not engines.get(PRIMARY_BIND):
+            return engine
+        if not replica_router.replicas or not self.reads_from_replicas():
+            return engine
+
+        bind_key = self.info.get(CHOSEN_BIND)
+        if bind_key is None:
+            bind_key = self.info[CHOSEN_BIND] = replica_router.choose(engines)
+        return engines[bind_key]
+
+    def retry_on_primary(self, method, *args, **kwargs):
+        """Run a statement, repeating it on the primary if the session's replica fails"""
+        replica_router.take_failure()
+        try:
+            return method(*args, **kwargs)
+        except (OperationalError, InterfaceError):
+            failed = replica_router.take_failure()
+            if failed is None or failed != self.info.get(CHOSEN_BIND):
+                raise
+            self.info[CHOSEN_BIND] = PRIMARY_BIND
+            return method(*args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self.retry_on_primary(super().execute, *args, **kwargs)
+
+    def scalar(self, *args, **kwargs):
+        return self.retry_on_primary(super().scalar, *args, **kwargs)
+
+    def scalars(self, *args, **kwargs):
+        return self.retry_on_primary(super().scalars, *args, **kwargs)
@@ -0,0 +1,309 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import String, and_, bindparam, cast, func, literal, or_, text
+from sqlalchemy.dialects.mysql import match as mysql_match
+from sqlalchemy.exc import OperationalError
+from . import db
+from .cache import version_column
+from .calsys import (
+    CalibratedBy, Device, Employee, Location, Owner, Period, Source, Status, Type
+)
+import re
+import threading
+
+# Searchable text columns of each indexed calsys table
+SEARCH_COLUMNS = {
+    Device: ('name', 'description', 'serialNumber'),
+    Location: ('ID', 'name'),
+    Type: ('ID', 'name'),
+    Owner: ('ID', 'name'),
+    Source: ('ID', 'name'),
+    Period: ('ID', 'name'),
+    Status: ('ID', 'name'),
+    Employee: ('ID', 'name'),
+    CalibratedBy: ('ID', 'name')
+}
+
+# Rows copied into the sidecar per statement during a rebuild or refresh
+SYNC_BATCH_SIZE = 1000
+
+class SearchIndexState(db.Model):
+    """Sync position of one table's local FTS5 search index"""
+    __tablename__ = 'search_index_state'
+
+    name = db.Column(db.String(50), primary_key=True)
+    high_water = db.Column(db.DateTime)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime)
+    # Bumped whenever a refresh changes the indexed contents
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+def search_terms(search):
+    """Lower-cased words of a search string; each one is matched as a prefix"""
+    return re.findall(r'\w+', search.lower())
+
+def row_matches(values, terms):
+    """In-memory equivalent of the index: every term prefixes a word of ``values``"""
+    words = search_terms(' '.join(str(value) for value in values if value is not None))
+    return all(any(word.startswith(term) for word in words) for term in terms)
+
+def like_condition(model, terms, columns=None):
+    """Unindexed word-prefix match, used when no index can answer
+
+    ``columns`` overrides the model's searchable columns.
+    """
+    columns = columns or SEARCH_COLUMNS[model]
+    conditions = []
+    for term in terms:
+        pattern = term.replace('\\', '\\\\').replace('_', '\\_')
+        conditions.append(or_(*(
+            condition
+            for column in columns
+            for condition in (
+                getattr(model, column).ilike(f'{pattern}%', escape='\\'),
+                getattr(model, column).ilike(f'% {pattern}%', escape='\\')
+            )
+        )))
+    return and_(*conditions)
+
+def relevance_order(column, keys):
+    """Order rows by their position in a relevance-ranked list of keys
+
+    The ranking travels as one delimited string parameter, which stays cheap
+    to build and compile however many keys there are.
+    """
+    ranking = ',' + ','.join(str(key) for key in keys) + ','
+    return func.instr(literal(ranking), literal(',') + cast(column, String) + literal(','))
+
+class SearchIndex:
+    """Word-prefix search over calsys tables, ranked by relevance
+
+    ``SEARCH_BACKEND`` selects where the index lives:
+
+    * ``fts5`` (default) keeps an FTS5 sidecar table per calsys table in the
+      local SQLite database, refreshed incrementally from ``timeStamp`` (or
+      ``updated_at``) at most every ``SEARCH_INDEX_REFRESH_INTERVAL`` seconds.
+      Deleted rows are noticed from the row count and trigger a rebuild.
+    * ``mysql`` queries FULLTEXT indexes on calsys directly; create them
+      with ``flask calsys create-fulltext-indexes``.
+    * ``like`` disables the index.
+
+    ``match`` returns None when the index cannot answer, including when more
+    than ``SEARCH_MAX_MATCHES`` rows match, and callers fall back to
+    ``like_condition``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fts5_available = None
+
+    def backend(self):
+        backend = current_app.config.get('SEARCH_BACKEND', 'fts5')
+        if backend == 'fts5' and self.fts5_available is False:
+            return 'like'
+        return backend
+
+    def table_name(self, model):
+        return f'search_{model.__tablename__}'
+
+    def create_table(self, model):
+        columns = ', '.join(SEARCH_COLUMNS[model])
+        try:
+            db.session.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table_name(model)} "
+                f"USING fts5(key UNINDEXED, {columns}, prefix='2 3')"
+            ))
+        except OperationalError:
+            db.session.rollback()
+            self.fts5_available = False
+            current_app.logger.warning('SQLite FTS5 is unavailable, search falls back to LIKE')
+            return False
+        self.fts5_available = True
+        return True
+
+    def source_rows(self, model, condition=None):
+        """Batches of (key, *text columns) from calsys in primary key order"""
+        columns = [model.ID] + [getattr(model, column) for column in SEARCH_COLUMNS[model]]
+        last = None
+        while True:
+            stmt = db.select(*columns).order_by(model.ID).limit(SYNC_BATCH_SIZE)
+            if condition is not None:
+                stmt = stmt.where(condition)
+            if last is not None:
+                stmt = stmt.where(model.ID > last)
+            rows = db.session.execute(stmt).all()
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][0]
+
+    def insert_rows(self, model, rows):
+        names = SEARCH_COLUMNS[model]
+        columns = ', '.join(names)
+        params = ', '.join(f':{name}' for name in names)
+        integer_key = model.ID.type.python_type is int
+        db.session.execute(text(
+            f"INSERT INTO {self.table_name(model)} (rowid, key, {columns}) VALUES (:rowid, :key, {params})"
+        ), [
+            {'rowid': row[0] if integer_key else None, 'key': str(row[0]),
+             **{name: value for name, value in zip(names, row[1:])}}
+            for row in rows
+        ])
+
+    def key_filter(self, model, keys):
+        """WHERE clause and parameters selecting ``keys`` in the sidecar"""
+        if model.ID.type.python_type is int:
+            condition, keys = 'rowid IN :keys', [int(key) for key in keys]
+        else:
+            condition, keys = 'key IN :keys', [str(key) for key in keys]
+        return condition, {'keys': keys}
+
+    def indexed_rows(self, model, keys):
+        """Currently indexed (key, *text columns) tuples for ``keys``, by key"""
+        condition, params = self.key_filter(model, keys)
+        stmt = text(
+            f"SELECT key, {', '.join(SEARCH_COLUMNS[model])} FROM {self.table_name(model)} WHERE {condition}"
+        ).bindparams(bindparam('keys', expanding=True))
+        return {row[0]: tuple(row[1:]) for row in db.session.execute(stmt, params)}
+
+    def delete_rows(self, model, keys):
+        condition, params = self.key_filter(model, keys)
+        stmt = text(f"DELETE FROM {self.table_name(model)} WHERE {condition}").bindparams(
+            bindparam('keys', expanding=True)
+        )
+        db.session.execute(stmt, params)
+
+    def source_version(self, model):
+        column = version_column(model)
+        return tuple(db.session.execute(
+            db.select(func.max(column), func.count()).select_from(model)
+        ).one())
+
+    def rebuild(self, model):
+        """Re-copy every row of a table into its sidecar"""
+        with self.lock:
+            if not self.create_table(model):
+                return None
+            high_water, row_count = self.source_version(model)
+            db.session.execute(text(f"DELETE FROM {self.table_name(model)}"))
+            for rows in self.source_rows(model):
+                self.insert_rows(model, rows)
+
+            state = db.session.get(SearchIndexState, model.__tablename__) or SearchIndexState(name=model.__tablename__)
+            state.high_water = high_water
+            state.row_count = row_count
+            state.refreshed_at = datetime.utcnow()
+            state.version = (state.version or 0) + 1
+            db.session.add(state)
+            db.session.commit()
+            return row_count
+
+    def refresh(self, model, state):
+        """Copy rows changed since the last sync, rebuilding if rows were deleted
+
+        Rows stamped at the previous high-water mark are read again, since
+        writes can land within the same second after the last refresh.
+        """
+        with self.lock:
+            high_water, row_count = self.source_version(model)
+            changed = version_column(model) >= state.high_water if state.high_water is not None else None
+
+            indexed = state.row_count
+            changes = 0
+            for rows in self.source_rows(model, changed):
+                existing = self.indexed_rows(model, [row[0] for row in rows])
+                stale = [row for row in rows if existing.get(str(row[0])) != tuple(row[1:])]
+                if not stale:
+                    continue
+                self.delete_rows(model, [row[0] for row in stale])
+                self.insert_rows(model, stale)
+                indexed += sum(1 for row in stale if str(row[0]) not in existing)
+                changes += len(stale)
+
+            if indexed != row_count:
+                db.session.rollback()
+                needs_rebuild = True
+            else:
+                needs_rebuild = False
+                if changes:
+                    state.version = (state.version or 0) + 1
+                state.high_water = high_water or state.high_water
+                state.row_count = row_count
+                state.refreshed_at = datetime.utcnow()
+                db.session.commit()
+
+        if needs_rebuild:
+            self.rebuild(model)
+
+    def state(self, model):
+        """Sync state of a table's sidecar, bringing it up to date first if due"""
+        if self.fts5_available is None and not self.create_table(model):
+            return None
+        state = db.session.get(SearchIndexState, model.__tablename__)
+        if state is None:
+            self.rebuild(model)
+            return db.session.get(SearchIndexState, model.__tablename__)
+
+        interval = current_app.config.get('SEARCH_INDEX_REFRESH_INTERVAL', 30)
+        if (datetime.utcnow() - state.refreshed_at).total_seconds() >= interval:
+            try:
+                self.refresh(model, state)
+            except OperationalError:
+                db.session.rollback()
+                current_app.logger.exception('Search index refresh failed for %s', model.__tablename__)
+            state = db.session.get(SearchIndexState, model.__tablename__)
+        return state
+
+    def version(self, model):
+        """Validator component for responses that depend on the index"""
+        if self.backend() != 'fts5':
+            return None
+        state = self.state(model)
+        return state.version if state is not None else None
+
+    def match(self, model, search):
+        """Keys of the rows matching ``search``, most relevant first"""
+        terms = search_terms(search)
+        backend = self.backend()
+        if not terms or backend not in ('fts5', 'mysql'):
+            return None
+
+        limit = current_app.config.get('SEARCH_MAX_MATCHES', 2000)
+        if backend == 'mysql':
+            against = mysql_match(
+                *(getattr(model, column) for column in SEARCH_COLUMNS[model]),
+                against=' '.join(f'+{term}*' for term in terms)
+            ).in_boolean_mode()
+            keys = db.session.execute(
+                db.select(model.ID).where(against).order_by(against.desc(), model.ID).limit(limit + 1)
+            ).scalars().all()
+        else:
+            if self.state(model) is None:
+                return None
+            # Sorting by rank in SQL would score every match before the LIMIT
+            # applies; unsorted, the scan stops as soon as the cap is exceeded
+            query = ' '.join(f'"{term}"*' for term in terms)
+            rows = db.session.execute(text(
+                f"SELECT key, rank FROM {self.table_name(model)} WHERE {self.table_name(model)} MATCH :query "
+                f"LIMIT :limit"
+            ), {'query': query, 'limit': limit + 1}).all()
+            keys = [key for key, rank in sorted(rows, key=lambda row: row[1])]
+            if model.ID.type.python_type is int:
+                keys = [int(key) for key in keys]
+
+        # Too broad for the index to help; scanning is as cheap
+        if len(keys) > limit:
+            return None
+        return keys
+
+    def create_fulltext_indexes(self):
+        """Create the FULLTEXT indexes the ``mysql`` backend queries"""
+        for model, columns in SEARCH_COLUMNS.items():
+            db.session.execute(
+                text(f"CREATE FULLTEXT INDEX ft_{model.__tablename__}_search ON {model.__tablename__} "
+                     f"({', '.join(columns)})"),
+                bind_arguments={'mapper': model}
+            )
+        db.session.commit()
+
+search_index = SearchIndex()
@@ -0,0 +1,114 @@
+from datetime import datetime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from . import db
+from .auth import UserSettings
+from .user_cache import user_cache
+import atexit
+import threading
+
+# Settings a user may change, with the type each value is stored as
+SETTINGS_FIELDS = {
+    'theme': str,
+    'items_per_page': int
+}
+
+class SettingsWriter:
+    """Coalesces settings updates and writes them in one transaction
+
+    Updates are merged per user and flushed ``SETTINGS_FLUSH_INTERVAL``
+    seconds after the first one arrives, so a burst of changes from any
+    number of users costs a single SQLite write. Reads overlay the pending
+    changes, and anything still pending is flushed at interpreter exit.
+    """
+
+    def __init__(self, app=None):
+        self.pending = {}
+        # Batch being written, still overlaid on reads until it is committed
+        self.flushing = {}
+        self.lock = threading.Lock()
+        self.timer = None
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SETTINGS_FLUSH_INTERVAL', 0.5)
+        self.app = app
+        self.interval = app.config['SETTINGS_FLUSH_INTERVAL']
+        atexit.register(self.flush)
+        app.extensions['settings_writer'] = self
+
+    def submit(self, user_id, changes):
+        """Queue changes for a user, returning everything pending for them"""
+        with self.lock:
+            pending = self.pending.setdefault(user_id, {})
+            pending.update(changes)
+            if self.timer is None:
+                self.timer = threading.Timer(self.interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+            return dict(pending)
+
+    def pending_for(self, user_id):
+        with self.lock:
+            return {**self.flushing.get(user_id, {}), **self.pending.get(user_id, {})}
+
+    def flush(self):
+        """Write every pending change in one transaction"""
+        with self.lock:
+            batch, self.pending = self.pending, {}
+            self.flushing = batch
+            self.timer = None
+        if not batch:
+            return
+
+        with self.app.app_context():
+            now = datetime.utcnow()
+            try:
+                for user_id, changes in batch.items():
+                    stmt = sqlite_insert(UserSettings).values(
+                        user_id=user_id, created_at=now, updated_at=now, **changes
+                    )
+                    db.session.execute(stmt.on_conflict_do_update(
+                        index_elements=[UserSettings.user_id],
+                        set_={**changes, 'updated_at': now}
+                    ))
+                db.session.commit()
+            except SQLAlchemyError:
+                db.session.rollback()
+                self.app.logger.exception('Writing %d users\' settings failed, retrying', len(batch))
+                with self.lock:
+                    self.flushing = {}
+                    # Keep anything newer that arrived while this batch was written
+                    for user_id, changes in batch.items():
+                        self.pending[user_id] = {**changes, **self.pending.get(user_id, {})}
+                    if self.timer is None:
+                        self.timer = threading.Timer(self.interval, self.flush)
+                        self.timer.daemon = True
+                        self.timer.start()
+                return
+
+        # Core upserts bypass the ORM events that keep the user cache fresh
+        for user_id in batch:
+            user_cache.invalidate(user_id)
+        with self.lock:
+            self.flushing = {}
+
+settings_writer = SettingsWriter()
+
+def parse_settings(data):
+    """Known settings from a request body, converted to their stored types
+
+    Raises ``ValueError`` for a value of the wrong type.
+    """
+    return {
+        field: convert(data[field])
+        for field, convert in SETTINGS_FIELDS.items()
+        if field in data
+    }
+
+def current_settings(user_id):
+    """A user's settings, with defaults if they have no row and pending changes applied"""
+    settings = user_cache.settings(user_id) or UserSettings.defaults(user_id)
+    return {**settings, **settings_writer.pending_for(user_id)}
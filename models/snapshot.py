@@ -0,0 +1,172 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func, literal_column, true
+from sqlalchemy.exc import SQLAlchemyError
+from . import db
+from .calsys import Calibration, Device
+import threading
+
+# Device IDs refreshed per statement during an incremental refresh
+REFRESH_CHUNK_SIZE = 500
+
+class SnapshotState(db.Model):
+    """High-water marks of locally maintained calsys snapshots"""
+    __tablename__ = 'snapshot_state'
+
+    name = db.Column(db.String(50), primary_key=True)
+    calibration_high_water = db.Column(db.DateTime)
+    device_high_water = db.Column(db.DateTime)
+    refreshed_at = db.Column(db.DateTime)
+    rebuilt_at = db.Column(db.DateTime)
+    # Bumped whenever a refresh changes the snapshot's contents
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class CalibrationDueSnapshot(db.Model):
+    """Local copy of the calibrationDue view, one row per device"""
+    __tablename__ = 'calibration_due_snapshot'
+
+    deviceID = db.Column(db.String(15), primary_key=True)
+    ID = db.Column(db.Integer)
+    name = db.Column(db.String(50))
+    description = db.Column(db.String(50))
+    typeID = db.Column(db.String(15))
+    location = db.Column(db.String(15))
+    status = db.Column(db.String(15))
+    calDate = db.Column(db.Date)
+    calDue = db.Column(db.Date, index=True)
+    period = db.Column(db.String(15))
+
+    # Same column order as the calibrationDue view
+    COLUMNS = ('ID', 'deviceID', 'name', 'description', 'typeID',
+               'location', 'status', 'calDate', 'calDue', 'period')
+
+SNAPSHOT_NAME = 'calibration_due'
+
+refresh_lock = threading.Lock()
+
+def high_water_marks():
+    """Current max timeStamp of the calibration and device tables"""
+    return (
+        db.session.execute(db.select(func.max(Calibration.timeStamp))).scalar(),
+        db.session.execute(db.select(func.max(Device.timeStamp))).scalar()
+    )
+
+def changed_since(column, high_water):
+    if high_water is None:
+        return true()
+    return column >= high_water
+
+def latest_due_rows(device_ids=None):
+    """calibrationDue rows for a set of devices, or all, read from the base tables"""
+    latest_ids = db.select(func.max(Calibration.ID)).group_by(Calibration.deviceID)
+    if device_ids is not None:
+        latest_ids = latest_ids.where(Calibration.deviceID.in_(device_ids))
+    stmt = (
+        db.select(
+            Calibration.ID, Calibration.deviceID, Device.name, Device.description,
+            Device.typeID, Device.location, Calibration.status, Calibration.calDate,
+            Calibration.calDue, Device.period
+        )
+        .join(Device, Device.ID == Calibration.deviceID)
+        .where(Calibration.ID.in_(latest_ids))
+        .where(Calibration.calDue > literal_column('0'))
+    )
+    return [dict(row._mapping) for row in db.session.execute(stmt)]
+
+def rebuild_calibration_due():
+    """Replace the whole snapshot with the current calibrationDue contents"""
+    with refresh_lock:
+        calibration_high_water, device_high_water = high_water_marks()
+        rows = latest_due_rows()
+
+        db.session.query(CalibrationDueSnapshot).delete()
+        if rows:
+            db.session.execute(db.insert(CalibrationDueSnapshot), rows)
+
+        now = datetime.utcnow()
+        state = db.session.get(SnapshotState, SNAPSHOT_NAME) or SnapshotState(name=SNAPSHOT_NAME)
+        state.calibration_high_water = calibration_high_water
+        state.device_high_water = device_high_water
+        state.refreshed_at = now
+        state.rebuilt_at = now
+        state.version = (state.version or 0) + 1
+        db.session.add(state)
+        db.session.commit()
+        return len(rows)
+
+def refresh_calibration_due(state):
+    """Re-read only the devices whose calibrations or details changed
+
+    Rows stamped at the previous high-water mark are read again, since
+    writes can land within the same second after the last refresh.
+    Deleted calibrations are only picked up by a full rebuild.
+    """
+    with refresh_lock:
+        calibration_high_water, device_high_water = high_water_marks()
+
+        changed = db.union(
+            db.select(Calibration.deviceID.label('deviceID'))
+            .where(changed_since(Calibration.timeStamp, state.calibration_high_water)),
+            db.select(Device.ID.label('deviceID'))
+            .where(changed_since(Device.timeStamp, state.device_high_water))
+        )
+        result = db.session.execute(changed, bind_arguments={'mapper': Calibration})
+        # calibration.deviceID is a string while device.ID is an integer
+        device_ids = sorted({str(device_id) for device_id in result.scalars()})
+
+        changes = 0
+        for start in range(0, len(device_ids), REFRESH_CHUNK_SIZE):
+            chunk = device_ids[start:start + REFRESH_CHUNK_SIZE]
+            current = {
+                row['deviceID']: row for row in latest_due_rows(chunk)
+            }
+            existing = {
+                row.deviceID: dict(row._mapping) for row in db.session.execute(
+                    calibration_due_select().where(CalibrationDueSnapshot.deviceID.in_(chunk))
+                )
+            }
+            stale = [device_id for device_id in chunk if current.get(device_id) != existing.get(device_id)]
+            if not stale:
+                continue
+
+            changes += len(stale)
+            db.session.query(CalibrationDueSnapshot).filter(
+                CalibrationDueSnapshot.deviceID.in_(stale)
+            ).delete(synchronize_session=False)
+            rows = [current[device_id] for device_id in stale if device_id in current]
+            if rows:
+                db.session.execute(db.insert(CalibrationDueSnapshot), rows)
+
+        if changes:
+            state.version = (state.version or 0) + 1
+        state.calibration_high_water = calibration_high_water or state.calibration_high_water
+        state.device_high_water = device_high_water or state.device_high_water
+        state.refreshed_at = datetime.utcnow()
+        db.session.commit()
+        return changes
+
+def calibration_due_snapshot():
+    """Return the snapshot state, refreshing it first if it is out of date
+
+    A failed refresh is logged and the existing snapshot is served as is;
+    callers report its age from ``refreshed_at``.
+    """
+    state = db.session.get(SnapshotState, SNAPSHOT_NAME)
+    if state is None:
+        rebuild_calibration_due()
+        return db.session.get(SnapshotState, SNAPSHOT_NAME)
+
+    interval = current_app.config.get('CALIBRATION_DUE_REFRESH_INTERVAL', 60)
+    if (datetime.utcnow() - state.refreshed_at).total_seconds() >= interval:
+        try:
+            refresh_calibration_due(state)
+        except SQLAlchemyError:
+            db.session.rollback()
+            current_app.logger.exception('Calibration due snapshot refresh failed')
+            state = db.session.get(SnapshotState, SNAPSHOT_NAME)
+    return state
+
+def calibration_due_select():
+    """Snapshot rows in calibrationDue column order, soonest due first"""
+    columns = [getattr(CalibrationDueSnapshot, column) for column in CalibrationDueSnapshot.COLUMNS]
+    return db.select(*columns).order_by(CalibrationDueSnapshot.calDue, CalibrationDueSnapshot.ID)
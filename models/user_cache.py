@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from . import db
+from .auth import User, UserSettings
+import threading
+import time
+
+class UserCacheEntry:
+    """A detached user and, once read, their settings as a dict"""
+
+    def __init__(self, user, expires_at):
+        self.user = user
+        self.settings = None
+        self.settings_loaded = False
+        self.expires_at = expires_at
+
+class UserCache:
+    """Bounded LRU of logged-in users and their settings
+
+    Keeps ``load_user`` and settings reads off the database for up to
+    ``USER_CACHE_TTL`` seconds, holding at most ``USER_CACHE_SIZE`` users.
+    Session ids carry the user's ``session_stamp``, so sessions from before
+    a password change stop loading. Commits that change a user or their
+    settings drop the cached copy in this process; other processes catch
+    up within the TTL.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def entry(self, user_id):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry.expires_at > now:
+                self.entries.move_to_end(user_id)
+                return entry
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        # Detached so later commits in this session don't expire the shared copy
+        db.session.expunge(user)
+
+        entry = UserCacheEntry(user, now + current_app.config.get('USER_CACHE_TTL', 60))
+        with self.lock:
+            self.entries[user_id] = entry
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > current_app.config.get('USER_CACHE_SIZE', 1024):
+                self.entries.popitem(last=False)
+        return entry
+
+    def load_user(self, session_id):
+        """Flask-Login user loader for ids of the form ``<id>:<session stamp>``"""
+        user_id, _, stamp = session_id.partition(':')
+        try:
+            entry = self.entry(int(user_id))
+        except ValueError:
+            return None
+        if entry is None:
+            return None
+        # Sessions created before stamps were added carry the bare id
+        if stamp and stamp != entry.user.session_stamp:
+            return None
+        return entry.user
+
+    def settings(self, user_id):
+        """The user's settings as a dict, or None if they have no settings row"""
+        entry = self.entry(user_id)
+        if entry is None:
+            return None
+        if not entry.settings_loaded:
+            settings = UserSettings.query.filter_by(user_id=user_id).first()
+            entry.settings = settings.to_dict() if settings is not None else None
+            entry.settings_loaded = True
+        return entry.settings
+
+    def invalidate(self, user_id=None):
+        """Drop one user, or every user, from the cache"""
+        with self.lock:
+            if user_id is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(user_id, None)
+
+user_cache = UserCache()
+
+def mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        user_id = target.id if isinstance(target, User) else target.user_id
+        session.info.setdefault('changed_user_ids', set()).add(user_id)
+
+for model in (User, UserSettings):
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, mark_changed)
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.invalidate(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
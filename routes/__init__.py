@@ -1,4 +1,9 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, jsonify, request
+from flask_login import login_required, current_user
+from models import db
+from models.pool import pool_status
+from models.replicas import replica_router
+from models.settings_writer import current_settings, parse_settings, settings_writer
 
 # Create main blueprint
 bp = Blueprint('main', __name__)
@@ -7,4 +12,33 @@ bp = Blueprint('main', __name__)
 def index():
     return render_template('index.html')
 
+@bp.route('/api/settings', methods=['GET', 'POST'])
+@login_required
+def handle_settings():
+    if request.method == 'POST':
+        try:
+            changes = parse_settings(request.get_json(silent=True) or {})
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid settings value'}), 400
+        
+        # Written in the background, coalesced with other updates
+        if changes:
+            settings_writer.submit(current_user.id, changes)
+        return jsonify(current_settings(current_user.id))
+    
+    # GET never writes: users without a settings row get the defaults
+    return jsonify(current_settings(current_user.id))
+
+@bp.route('/api/metrics/pools')
+@login_required
+def pool_metrics():
+    """Connection pool occupancy and checkout wait times per bind"""
+    return jsonify(pool_status(db.engines))
+
+@bp.route('/api/metrics/replicas')
+@login_required
+def replica_metrics():
+    """Lag and health of each calsys read replica"""
+    return jsonify(replica_router.status())
+
 from . import calsys
@@ -1,296 +1,1014 @@
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, jsonify, request, abort, current_app, make_response, send_file, url_for
 from flask_login import login_required
-from sqlalchemy import or_
+from sqlalchemy import or_, and_, func
 from models.calsys import (
     Device, Calibration, Employee, Location, Owner,
     Period, Source, Status, Type, CalibratedBy,
-    get_calibration_due, get_cal_export
+    cal_export_select, get_cal_export
 )
 from models import db
-from datetime import datetime
-import csv
-import io
-import pandas as pd
+from models.cache import reference_cache, table_versions
+from models.replicas import use_replicas
+from models.snapshot import (
+    CalibrationDueSnapshot, calibration_due_select, calibration_due_snapshot, rebuild_calibration_due
+)
+from models.latest_calibration import (
+    check_latest_calibrations, latest_calibrations, rebuild_latest_calibrations, update_latest_calibrations
+)
+from models.search import SEARCH_COLUMNS, like_condition, relevance_order, row_matches, search_index, search_terms
+from models.kpi import DEFAULT_BUCKETS, KPI_DIMENSIONS, MAX_BUCKETS, calibration_kpis, kpi_cache
+from models.projection import enrich_items, row_serializer, DEVICE_RELATIONS, CALIBRATION_RELATIONS
+from routes.export import EXPORT_BATCH_SIZE, EXCEL_MIMETYPE, send_excel, stream_csv
+from routes.export_jobs import export_jobs
+from routes.imports import insert_calibrations, read_upload, upload_format, validate_calibrations
+from routes.json_provider import stream_json, wants_ndjson
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from functools import wraps
+import base64
+import click
+import hashlib
+import json
+import os
+import sys
+import threading
 
 bp = Blueprint('calsys', __name__, url_prefix='/api/calsys')
 
-def paginate_query(query, schema=None):
-    """Helper function to paginate query results"""
+# Execution options for view queries whose rows are streamed to an export
+STREAM_OPTIONS = {'stream_results': True, 'yield_per': EXPORT_BATCH_SIZE}
+
+def conditional(validator):
+    """Answer GET requests with 304 when the ETag from ``validator`` matches
+    
+    The validator receives the view arguments and returns a small value
+    that changes whenever the response would; it is combined with the
+    request path and query args into the ETag. Exports are never conditional.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.args.get('export'):
+                return view(*args, **kwargs)
+            
+            version = validator(*args, **kwargs)
+            if version is None:
+                return view(*args, **kwargs)
+            
+            key = repr((request.path, sorted(request.args.items(multi=True)), version))
+            etag = hashlib.sha1(key.encode()).hexdigest()
+            if etag in request.if_none_match:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+@bp.errorhandler(400)
+def bad_request(error):
+    return jsonify({'error': error.description}), 400
+
+def apply_sort(query, model, args, default_sort_by, default_sort_order):
+    """Apply the requested sort column and direction to a query"""
+    sort_by = args.get('sort_by', default_sort_by)
+    sort_order = args.get('sort_order', default_sort_order)
+    descending = sort_order == 'desc'
+    
+    sort_column = model.__table__.columns.get(sort_by)
+    if sort_column is not None:
+        sort_column = getattr(model, sort_column.key)
+        query = query.order_by(sort_column.desc() if descending else sort_column)
+    
+    return query, (sort_column, descending)
+
+def encode_cursor(column, row, direction):
+    """Build an opaque cursor pointing at a row of the current page"""
+    value = getattr(row, column.key)
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    payload = json.dumps([value, row.ID, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(column, cursor):
+    """Decode a cursor into its (sort value, ID, direction) parts"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, ident, direction = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        if value is not None:
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+    except (ValueError, TypeError):
+        abort(400, description='Invalid cursor')
+    return value, ident, direction
+
+def keyset_condition(column, pk, value, ident, descending):
+    """Filter for rows strictly after (value, ident) in the scan order.
+
+    NULL sorts lowest, matching MySQL and SQLite.
+    """
+    if column is pk:
+        return pk < ident if descending else pk > ident
+    if descending:
+        if value is None:
+            return and_(column.is_(None), pk < ident)
+        return or_(column < value, and_(column == value, pk < ident), column.is_(None))
+    if value is None:
+        return or_(column.isnot(None), and_(column.is_(None), pk > ident))
+    return or_(column > value, and_(column == value, pk > ident))
+
+def keyset_order(query, pk, sort, after=None, backwards=False):
+    """Order a query on (sort column, ID), resuming after a (value, ID) position"""
+    sort_column, descending = sort
+    if sort_column is None:
+        sort_column = pk
+    
+    scan_desc = descending != backwards
+    query = query.order_by(None)
+    if after is not None:
+        query = query.filter(keyset_condition(sort_column, pk, *after, scan_desc))
+    
+    order_columns = [pk] if sort_column is pk else [sort_column, pk]
+    query = query.order_by(*[c.desc() if scan_desc else c.asc() for c in order_columns])
+    return query, sort_column
+
+def keyset_page(query, pk, sort, per_page, fetch):
+    """Fetch the page at the requested ``cursor``, scanning on (sort column, ID)
+    
+    ``fetch`` runs the limited query and returns its rows. Returns the rows
+    in display order along with the cursors of the neighbouring pages.
+    """
+    sort_column = sort[0] if sort[0] is not None else pk
+    
+    cursor = request.args.get('cursor')
+    after = None
+    backwards = False
+    if cursor:
+        value, ident, direction = decode_cursor(sort_column, cursor)
+        after = (value, ident)
+        backwards = direction == 'prev'
+    
+    query, sort_column = keyset_order(query, pk, sort, after, backwards)
+    
+    rows = fetch(query.limit(per_page + 1))
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    
+    has_next = has_more if not backwards else True
+    has_prev = bool(cursor) if not backwards else has_more
+    
+    return rows, {
+        'per_page': per_page,
+        'next_cursor': encode_cursor(sort_column, rows[-1], 'next') if rows and has_next else None,
+        'prev_cursor': encode_cursor(sort_column, rows[0], 'prev') if rows and has_prev else None
+    }
+
+def keyset_paginate(query, model, sort, per_page):
+    """Paginate on (sort column, ID) instead of OFFSET, without a full COUNT"""
+    serializer = row_serializer(model)
+    query = query.with_entities(*serializer.columns)
+    base = query.order_by(None)
+    
+    rows, result = keyset_page(query, model.ID, sort, per_page, lambda page: page.all())
+    result['items'] = serializer.dicts(rows)
+    
+    # Counting the filtered set is opt-in since it scans every matching row
+    if request.args.get('with_total'):
+        result['total'] = base.count()
+    
+    return result
+
+def paginate_query(query, schema=None, model=None, sort=(None, False)):
+    """Helper function to paginate query results
+    
+    Callers that supply their model get rows selected as plain table
+    columns and serialized without building ORM objects. Passing
+    ``cursor`` (empty for the first page) then switches to keyset
+    pagination.
+    """
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     per_page = min(per_page, 100)  # Limit maximum items per page
     
-    paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+    if model is not None and 'cursor' in request.args:
+        return keyset_paginate(query, model, sort, per_page)
+    
+    if model is None:
+        paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+        items = [item.to_dict() for item in paginated.items]
+    else:
+        serializer = row_serializer(model)
+        paginated = query.with_entities(*serializer.columns).paginate(page=page, per_page=per_page, error_out=False)
+        items = serializer.dicts(paginated.items)
     
     return {
-        'items': [item.to_dict() for item in paginated.items],
+        'items': items,
         'total': paginated.total,
         'page': page,
         'per_page': per_page,
         'pages': paginated.pages
     }
 
-@bp.route('/devices', methods=['GET'])
-@login_required
-def get_devices():
-    """Get all devices with filtering, search, and pagination"""
+def search_version(model):
+    """Search index state for the ETag, since matches can move when the index syncs"""
+    return search_index.version(model) if request.args.get('search') else None
+
+def device_query(args):
+    """Build the filtered and sorted device query for a set of request args"""
     query = Device.query
     
     # Search functionality
-    search = request.args.get('search')
+    search = args.get('search')
+    ranked = None
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(or_(
-            Device.name.ilike(search_term),
-            Device.description.ilike(search_term),
-            Device.serialNumber.ilike(search_term)
-        ))
+        ranked = search_index.match(Device, search)
+        if ranked is None:
+            query = query.filter(like_condition(Device, search_terms(search)))
+        else:
+            query = query.filter(Device.ID.in_(ranked))
     
     # Advanced filtering
-    location = request.args.get('location')
+    location = args.get('location')
     if location:
         query = query.filter(Device.location == location)
     
-    device_type = request.args.get('type')
+    device_type = args.get('type')
     if device_type:
         query = query.filter(Device.typeID == device_type)
     
-    owner = request.args.get('owner')
+    owner = args.get('owner')
     if owner:
         query = query.filter(Device.ownerID == owner)
     
-    period = request.args.get('period')
+    period = args.get('period')
     if period:
         query = query.filter(Device.period == period)
     
     # Sort options
-    sort_by = request.args.get('sort_by', 'name')
-    sort_order = request.args.get('sort_order', 'asc')
+    query, sort = apply_sort(query, Device, args, 'name', 'asc')
     
-    if hasattr(Device, sort_by):
-        sort_column = getattr(Device, sort_by)
-        if sort_order == 'desc':
-            sort_column = sort_column.desc()
-        query = query.order_by(sort_column)
+    # Best matches first unless a sort was asked for; keyset paging keeps its own order
+    if ranked and 'sort_by' not in args:
+        query = query.order_by(None).order_by(relevance_order(Device.ID, ranked), Device.ID)
+    return query, sort
+
+@bp.route('/devices', methods=['GET'])
+@login_required
+@conditional(lambda: (table_versions(Device, Type, Location, Owner, Source), search_version(Device)))
+def get_devices():
+    """Get all devices with filtering, search, and pagination"""
+    query, sort = device_query(request.args)
     
     # Handle export request
     if request.args.get('export'):
         format = request.args.get('format', 'csv')
-        return export_query(query, format, 'devices')
+        return export_query(query, Device, sort, format, 'devices')
     
     # Paginate results
-    result = paginate_query(query)
+    result = paginate_query(query, model=Device, sort=sort)
     
     # Enhance response with related data
-    enhanced_items = [{
-        **item,
-        'type_name': Device.query.get(item['ID']).device_type.name if Device.query.get(item['ID']).device_type else None,
-        'location_name': Device.query.get(item['ID']).device_location.name if Device.query.get(item['ID']).device_location else None,
-        'owner_name': Device.query.get(item['ID']).owner.name if Device.query.get(item['ID']).owner else None,
-        'source_name': Device.query.get(item['ID']).source.name if Device.query.get(item['ID']).source else None
-    } for item in result['items']]
-    
-    result['items'] = enhanced_items
+    result['items'] = enrich_items(Device, result['items'], DEVICE_RELATIONS)
     return jsonify(result)
 
-@bp.route('/calibrations', methods=['GET'])
-@login_required
-def get_calibrations():
-    """Get calibrations with filtering, search, and pagination"""
+def calibration_query(args):
+    """Build the filtered and sorted calibration query for a set of request args"""
     query = Calibration.query
     
     # Search functionality
-    search = request.args.get('search')
+    search = args.get('search')
     if search:
-        search_term = f"%{search}%"
-        query = query.join(Device).filter(or_(
-            Device.name.ilike(search_term),
-            Device.serialNumber.ilike(search_term)
-        ))
+        device_ids = search_index.match(Device, search)
+        if device_ids is None:
+            query = query.join(Device).filter(like_condition(Device, search_terms(search)))
+        else:
+            query = query.filter(Calibration.deviceID.in_([str(device_id) for device_id in device_ids]))
     
     # Advanced filtering
-    device_id = request.args.get('device_id')
+    device_id = args.get('device_id')
     if device_id:
         query = query.filter(Calibration.deviceID == device_id)
     
-    status = request.args.get('status')
+    status = args.get('status')
     if status:
         query = query.filter(Calibration.status == status)
     
-    start_date = request.args.get('start_date')
+    start_date = args.get('start_date')
     if start_date:
         query = query.filter(Calibration.calDate >= start_date)
     
-    end_date = request.args.get('end_date')
+    end_date = args.get('end_date')
     if end_date:
         query = query.filter(Calibration.calDate <= end_date)
     
-    employee_id = request.args.get('employee_id')
+    employee_id = args.get('employee_id')
     if employee_id:
         query = query.filter(Calibration.employeeID == employee_id)
     
     # Sort options
-    sort_by = request.args.get('sort_by', 'calDate')
-    sort_order = request.args.get('sort_order', 'desc')
-    
-    if hasattr(Calibration, sort_by):
-        sort_column = getattr(Calibration, sort_by)
-        if sort_order == 'desc':
-            sort_column = sort_column.desc()
-        query = query.order_by(sort_column)
+    query, sort = apply_sort(query, Calibration, args, 'calDate', 'desc')
+    return query, sort
+
+@bp.route('/calibrations', methods=['GET'])
+@login_required
+@conditional(lambda: (table_versions(Calibration, Device, CalibratedBy, Employee, Status), search_version(Device)))
+def get_calibrations():
+    """Get calibrations with filtering, search, and pagination"""
+    query, sort = calibration_query(request.args)
     
     # Handle export request
     if request.args.get('export'):
         format = request.args.get('format', 'csv')
-        return export_query(query, format, 'calibrations')
+        return export_query(query, Calibration, sort, format, 'calibrations')
     
     # Paginate results
-    result = paginate_query(query)
+    result = paginate_query(query, model=Calibration, sort=sort)
     
     # Enhance response with related data
-    enhanced_items = [{
-        **item,
-        'device_name': Calibration.query.get(item['ID']).device.name if Calibration.query.get(item['ID']).device else None,
-        'calibrated_by_name': Calibration.query.get(item['ID']).calibrated_by.name if Calibration.query.get(item['ID']).calibrated_by else None,
-        'employee_name': Calibration.query.get(item['ID']).employee.name if Calibration.query.get(item['ID']).employee else None,
-        'status_name': Calibration.query.get(item['ID']).status_info.name if Calibration.query.get(item['ID']).status_info else None
-    } for item in result['items']]
-    
-    result['items'] = enhanced_items
+    result['items'] = enrich_items(Calibration, result['items'], CALIBRATION_RELATIONS)
     return jsonify(result)
 
-def export_query(query, format='csv', filename_prefix='export'):
+def iter_export_rows(query, model, sort):
+    """Yield the table columns of every row in keyset-ordered batches
+    
+    Each batch is a bounded indexed range query, so memory stays flat
+    regardless of driver support for server-side cursors.
+    """
+    query = query.with_entities(*model.__table__.columns)
+    after = None
+    while True:
+        batch_query, sort_column = keyset_order(query, model.ID, sort, after)
+        rows = batch_query.limit(EXPORT_BATCH_SIZE).all()
+        yield from rows
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+        last = rows[-1]
+        after = (getattr(last, sort_column.key), last.ID)
+
+def export_query(query, model, sort, format='csv', filename_prefix='export'):
     """Export query results to CSV or Excel"""
-    # Convert query results to pandas DataFrame
-    data = [item.to_dict() for item in query.all()]
-    df = pd.DataFrame(data)
-    
-    # Create in-memory buffer
-    output = io.BytesIO()
+    serializer = row_serializer(model)
+    rows = iter_export_rows(query, model, sort)
     
     if format == 'excel':
-        # Export to Excel
-        df.to_excel(output, index=False, engine='openpyxl')
-        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        extension = 'xlsx'
-    else:
-        # Export to CSV
-        df.to_csv(output, index=False)
-        mimetype = 'text/csv'
-        extension = 'csv'
+        return send_excel(list(serializer.keys), rows, filename_prefix)
+    return stream_csv(list(serializer.keys), rows, filename_prefix, convert=serializer.values)
+
+def export_result(result, format='csv', filename_prefix='export'):
+    """Export the rows of an executed view query to CSV or Excel"""
+    if format == 'excel':
+        return send_excel(list(result.keys()), result, filename_prefix)
+    return stream_csv(list(result.keys()), result, filename_prefix)
+
+# Background export jobs, produced from the same filters as the endpoints above
+def device_export_rows(args):
+    query, sort = device_query(args)
+    return [column.name for column in Device.__table__.columns], iter_export_rows(query, Device, sort)
+
+def calibration_export_rows(args):
+    query, sort = calibration_query(args)
+    return [column.name for column in Calibration.__table__.columns], iter_export_rows(query, Calibration, sort)
+
+def calibration_due_export_rows(args):
+    calibration_due_snapshot()
+    stmt = calibration_due_query(args)[0]
+    result = db.session.execute(stmt, execution_options=STREAM_OPTIONS)
+    return list(result.keys()), result
+
+def cal_export_rows(args):
+    latest_calibrations()
+    result = get_cal_export(db.session, cal_export_query(args)[0], execution_options=STREAM_OPTIONS)
+    return list(result.keys()), result
+
+export_jobs.register('devices', device_export_rows)
+export_jobs.register('calibrations', calibration_export_rows)
+export_jobs.register('calibration-due', calibration_due_export_rows)
+export_jobs.register('cal-export', cal_export_rows)
+
+def export_job_response(job, status=200):
+    result = job.to_dict()
+    result['status_url'] = url_for('calsys.export_job_status', job_id=job.id)
+    if job.status == 'done':
+        result['download_url'] = url_for('calsys.export_job_download', job_id=job.id)
+    return jsonify(result), status
+
+@bp.route('/exports/<string:source>', methods=['POST'])
+@login_required
+def create_export_job(source):
+    """Start a background export using the same query args as the listing"""
+    if source not in export_jobs.producers:
+        return jsonify({'error': 'Invalid export source'}), 404
+    
+    format = request.args.get('format', 'csv')
+    job, created = export_jobs.submit(source, format, request.args)
+    if job is None:
+        return jsonify({'error': 'Too many exports in progress'}), 429
+    
+    response, status = export_job_response(job, 202 if created else 200)
+    response.headers['Location'] = url_for('calsys.export_job_status', job_id=job.id)
+    return response, status
+
+@bp.route('/exports/<string:job_id>', methods=['GET'])
+@login_required
+def export_job_status(job_id):
+    """Report the progress of a background export"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found'}), 404
+    return export_job_response(job)
+
+@bp.route('/exports/<string:job_id>/download', methods=['GET'])
+@login_required
+def export_job_download(job_id):
+    """Download the spooled file of a finished export"""
+    job = export_jobs.get(job_id)
+    if job is None or (job.status == 'done' and not os.path.exists(job.path)):
+        return jsonify({'error': 'Export job not found'}), 404
+    if job.status != 'done':
+        return jsonify({'error': f'Export job is {job.status}'}), 409
     
-    output.seek(0)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     return send_file(
-        output,
-        mimetype=mimetype,
+        job.path,
+        mimetype=EXCEL_MIMETYPE if job.format == 'excel' else 'text/csv',
         as_attachment=True,
-        download_name=f'{filename_prefix}_{timestamp}.{extension}'
+        download_name=job.download_name
     )
 
+@bp.route('/calibrations/import', methods=['POST'])
+@login_required
+def import_calibrations():
+    """Bulk insert calibrations from an uploaded CSV or xlsx file
+    
+    The ``file`` upload has a header row of calibration columns. Every row
+    is validated first, foreign keys against the device, employee, status
+    and calibratedBy tables; the report lists each error by spreadsheet
+    row. With dry_run nothing is inserted. Any invalid row rejects the
+    whole file unless skip_invalid is set, which inserts the valid rows.
+    """
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': 'No file uploaded'}), 400
+    
+    try:
+        frame = read_upload(upload.stream, upload_format(upload.filename, request.args.get('format')))
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    
+    max_rows = current_app.config.get('IMPORT_MAX_ROWS', 100000)
+    if len(frame) > max_rows:
+        return jsonify({'error': f'Too many rows, at most {max_rows} per import'}), 413
+    
+    rows, errors = validate_calibrations(frame)
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    skip_invalid = request.args.get('skip_invalid', '').lower() in ('1', 'true', 'yes')
+    result = {
+        'rows': len(frame),
+        'valid': len(rows),
+        'invalid': len(frame) - len(rows),
+        'inserted': 0,
+        'dry_run': dry_run,
+        'errors': errors
+    }
+    if dry_run:
+        return jsonify(result)
+    if errors and not skip_invalid:
+        return jsonify(result), 422
+    
+    result['inserted'], failed = insert_calibrations(rows, current_app.config.get('IMPORT_BATCH_SIZE', 5000))
+    if failed:
+        result['failed'] = failed
+        return jsonify(result), 500
+    return jsonify(result), 201
+
+# DataTables sources: model, query builder, related names and the
+# per-column searches that map onto the listing filters (column -> arg)
+DATATABLES_SOURCES = {
+    'devices': (Device, device_query, DEVICE_RELATIONS, {
+        'location': 'location', 'typeID': 'type', 'ownerID': 'owner', 'period': 'period'
+    }),
+    'calibrations': (Calibration, calibration_query, CALIBRATION_RELATIONS, {
+        'deviceID': 'device_id', 'status': 'status', 'employeeID': 'employee_id'
+    })
+}
+
+def datatables_args(args, column_filters):
+    """Translate DataTables server-side parameters into listing query args"""
+    result = {}
+    
+    search = args.get('search[value]')
+    if search:
+        result['search'] = search
+    
+    columns = []
+    while f'columns[{len(columns)}][data]' in args:
+        index = len(columns)
+        column = args[f'columns[{index}][data]']
+        columns.append(column)
+        value = args.get(f'columns[{index}][search][value]')
+        if value and column in column_filters:
+            result[column_filters[column]] = value
+    
+    # Only the first ordering is applied, like the listing sort_by
+    order = args.get('order[0][column]', type=int)
+    if order is not None and 0 <= order < len(columns):
+        result['sort_by'] = columns[order]
+        result['sort_order'] = 'desc' if args.get('order[0][dir]') == 'desc' else 'asc'
+    
+    return result
+
+@bp.route('/datatables/<string:source>', methods=['GET'])
+@login_required
+def datatables(source):
+    """Serve a DataTables grid with server-side processing, one page at a time"""
+    if source not in DATATABLES_SOURCES:
+        return jsonify({'error': 'Invalid DataTables source'}), 404
+    
+    model, build_query, relations, column_filters = DATATABLES_SOURCES[source]
+    args = datatables_args(request.args, column_filters)
+    query = build_query(args)[0]
+    
+    start = max(request.args.get('start', 0, type=int), 0)
+    length = request.args.get('length', 10, type=int)
+    length = 100 if length < 0 else min(length, 100)  # "All" is capped like per_page
+    
+    total = db.session.execute(db.select(func.count()).select_from(model)).scalar()
+    filtered = query.order_by(None).count() if set(args) - {'sort_by', 'sort_order'} else total
+    serializer = row_serializer(model)
+    items = serializer.dicts(query.with_entities(*serializer.columns).offset(start).limit(length))
+    
+    return jsonify({
+        'draw': request.args.get('draw', 0, type=int),
+        'recordsTotal': total,
+        'recordsFiltered': filtered,
+        'data': enrich_items(model, items, relations)
+    })
+
+def filter_sort_rows(rows, model, args):
+    """Apply lookup search and sort to cached rows the way the SQL query would"""
+    search = args.get('search')
+    if search:
+        terms = search_terms(search)
+        columns = SEARCH_COLUMNS[model]
+        rows = [row for row in rows if row_matches([row[column] for column in columns], terms)]
+    
+    sort_by = args.get('sort_by', 'name')
+    if sort_by in model.__table__.columns:
+        def sort_key(row):
+            value = row[sort_by]
+            # NULLs first and case-insensitive text, as MySQL orders them
+            return (value is not None, value.lower() if isinstance(value, str) else value)
+        rows = sorted(rows, key=sort_key, reverse=args.get('sort_order', 'asc') == 'desc')
+    
+    return rows
+
+def paginate_rows(rows):
+    """Paginate an in-memory list of rows with the same shape as paginate_query"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', 10, type=int)
+    per_page = max(min(per_page, 100), 1)  # Limit maximum items per page
+    
+    total = len(rows)
+    start = (page - 1) * per_page
+    return {
+        'items': rows[start:start + per_page],
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': -(-total // per_page)
+    }
+
 # Lookup endpoints with pagination and search
+LOOKUP_TABLES = {
+    'locations': Location,
+    'types': Type,
+    'owners': Owner,
+    'sources': Source,
+    'periods': Period,
+    'statuses': Status,
+    'employees': Employee,
+    'calibrated-by': CalibratedBy
+}
+
+def lookup_version(table):
+    """Validator for a lookup table, taken from the cache when it serves the request"""
+    model = LOOKUP_TABLES.get(table)
+    if model is None:
+        return None
+    if 'cursor' not in request.args:
+        entry = reference_cache.entry(model)
+        if entry is not None:
+            return entry.version
+    return table_versions(model), search_version(model)
+
 @bp.route('/lookup/<string:table>', methods=['GET'])
 @login_required
+@conditional(lookup_version)
 def lookup(table):
     """Generic lookup endpoint for all reference tables"""
-    table_map = {
-        'locations': Location,
-        'types': Type,
-        'owners': Owner,
-        'sources': Source,
-        'periods': Period,
-        'statuses': Status,
-        'employees': Employee,
-        'calibrated-by': CalibratedBy
-    }
-    
-    if table not in table_map:
+    if table not in LOOKUP_TABLES:
         return jsonify({'error': 'Invalid lookup table'}), 404
     
-    model = table_map[table]
+    model = LOOKUP_TABLES[table]
+    
+    # Serve from the in-memory copy of the table unless keyset paging is requested
+    rows = reference_cache.rows(model) if 'cursor' not in request.args else None
+    if rows is not None:
+        return jsonify(paginate_rows(filter_sort_rows(rows, model, request.args)))
+    
     query = model.query
     
     # Search functionality
     search = request.args.get('search')
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(or_(
-            model.name.ilike(search_term),
-            model.ID.ilike(search_term)
-        ))
+        keys = search_index.match(model, search)
+        if keys is None:
+            query = query.filter(like_condition(model, search_terms(search)))
+        else:
+            query = query.filter(model.ID.in_(keys))
     
     # Sort options
-    sort_by = request.args.get('sort_by', 'name')
-    sort_order = request.args.get('sort_order', 'asc')
+    query, sort = apply_sort(query, model, request.args, 'name', 'asc')
     
-    if hasattr(model, sort_by):
-        sort_column = getattr(model, sort_by)
-        if sort_order == 'desc':
-            sort_column = sort_column.desc()
-        query = query.order_by(sort_column)
+    return jsonify(paginate_query(query, model=model, sort=sort))
+
+# Filters of the calibration-due and cal-export views, query arg -> column
+CALIBRATION_DUE_FILTERS = {
+    'location': CalibrationDueSnapshot.location,
+    'type': CalibrationDueSnapshot.typeID,
+    'status': CalibrationDueSnapshot.status,
+    'period': CalibrationDueSnapshot.period,
+    'device_id': CalibrationDueSnapshot.deviceID
+}
+
+CAL_EXPORT_FILTERS = {
+    'location': Device.location,
+    'type': Device.typeID,
+    'status': Calibration.status,
+    'employee_id': Calibration.employeeID,
+    'device_id': Calibration.deviceID
+}
+
+# Query args that ask a view for one page instead of every row
+VIEW_PAGE_ARGS = ('page', 'per_page', 'cursor')
+
+def date_arg(args, name):
+    """An ISO date query arg, or None when it is absent"""
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f'Invalid {name}, expected YYYY-MM-DD')
+
+def filter_view(stmt, args, filters, due_column):
+    """Add the equality filters and the due_from/due_to window to a view select"""
+    for arg, column in filters.items():
+        value = args.get(arg)
+        if value:
+            stmt = stmt.where(column == value)
+    
+    due_from = date_arg(args, 'due_from')
+    if due_from:
+        stmt = stmt.where(due_column >= due_from)
+    
+    due_to = date_arg(args, 'due_to')
+    if due_to:
+        stmt = stmt.where(due_column <= due_to)
+    return stmt
+
+def view_sort(stmt, args, default_sort_by, default_sort_order):
+    """The requested sort of a view select, as a (column, descending) pair"""
+    sort_by = args.get('sort_by', default_sort_by)
+    sort_order = args.get('sort_order', default_sort_order)
+    return stmt.selected_columns.get(sort_by), sort_order == 'desc'
+
+def paginate_view(stmt, pk, sort):
+    """Paginate a view select with the same shape as paginate_query
+    
+    Rows are returned as plain dicts of the view's columns. Passing
+    ``cursor`` (empty for the first page) switches to keyset pagination
+    on (sort column, ``pk``).
+    """
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', 10, type=int)
+    per_page = max(min(per_page, 100), 1)  # Limit maximum items per page
+    bind_arguments = {'mapper': pk.class_}
+    
+    def fetch(page_stmt):
+        return db.session.execute(page_stmt, bind_arguments=bind_arguments).all()
     
-    return jsonify(paginate_query(query))
+    def count():
+        counted = db.select(func.count()).select_from(stmt.order_by(None).subquery())
+        return db.session.execute(counted, bind_arguments=bind_arguments).scalar()
+    
+    if 'cursor' in request.args:
+        rows, result = keyset_page(stmt, pk, sort, per_page, fetch)
+        if request.args.get('with_total'):
+            result['total'] = count()
+    else:
+        ordered, _ = keyset_order(stmt, pk, sort)
+        rows = fetch(ordered.limit(per_page).offset((page - 1) * per_page))
+        total = count()
+        result = {
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'pages': -(-total // per_page)
+        }
+    
+    result['items'] = [dict(row._mapping) for row in rows]
+    return result
+
+def calibration_due_query(args):
+    """Build the filtered and sorted snapshot select for a set of request args"""
+    stmt = calibration_due_select()
+    
+    search = args.get('search')
+    if search:
+        device_ids = search_index.match(Device, search)
+        if device_ids is None:
+            # The snapshot carries the searchable device columns but serialNumber
+            stmt = stmt.where(like_condition(
+                CalibrationDueSnapshot, search_terms(search), ('name', 'description')
+            ))
+        else:
+            stmt = stmt.where(CalibrationDueSnapshot.deviceID.in_([str(device_id) for device_id in device_ids]))
+    
+    stmt = filter_view(stmt, args, CALIBRATION_DUE_FILTERS, CalibrationDueSnapshot.calDue)
+    
+    # Soonest due first by default, as the view orders it
+    sort = view_sort(stmt, args, 'calDue', 'asc')
+    stmt, _ = keyset_order(stmt, CalibrationDueSnapshot.ID, sort)
+    return stmt, sort
+
+def calibration_due_version():
+    """Validator for the due list: the snapshot's content version"""
+    state = calibration_due_snapshot()
+    return (state.version, state.rebuilt_at, search_version(Device))
 
 @bp.route('/calibration-due', methods=['GET'])
 @login_required
+@conditional(calibration_due_version)
 def calibration_due():
-    """Get list of devices due for calibration with filtering and export"""
-    result = get_calibration_due(db.session)
-    data = [dict(row) for row in result]
+    """Get list of devices due for calibration with filtering, pagination and export
+    
+    Filters by location, type, status, period, device_id, search and a
+    due_from/due_to window. Every matching row is streamed unless page,
+    per_page or cursor asks for one page. Served from the local snapshot;
+    its age is reported in the X-Snapshot-Refreshed-At and X-Snapshot-Age
+    headers.
+    """
+    state = calibration_due_snapshot()
+    stmt, sort = calibration_due_query(request.args)
     
     if request.args.get('export'):
-        df = pd.DataFrame(data)
         format = request.args.get('format', 'csv')
-        output = io.BytesIO()
-        
-        if format == 'excel':
-            df.to_excel(output, index=False, engine='openpyxl')
-            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            extension = 'xlsx'
+        result = db.session.execute(stmt, execution_options=STREAM_OPTIONS)
+        response = export_result(result, format, 'calibration_due')
+    elif any(arg in request.args for arg in VIEW_PAGE_ARGS):
+        response = jsonify(paginate_view(stmt, CalibrationDueSnapshot.ID, sort))
+    else:
+        result = db.session.execute(stmt, execution_options=STREAM_OPTIONS)
+        response = stream_json(result, ndjson=wants_ndjson(request))
+    
+    age = (datetime.utcnow() - state.refreshed_at).total_seconds()
+    response.headers['X-Snapshot-Refreshed-At'] = state.refreshed_at.isoformat()
+    response.headers['X-Snapshot-Age'] = str(int(age))
+    return response
+
+@bp.cli.command('rebuild-due-snapshot')
+def rebuild_due_snapshot():
+    """Rebuild the calibration due snapshot from the calsys tables"""
+    count = rebuild_calibration_due()
+    print(f'Rebuilt calibration due snapshot with {count} rows')
+
+@bp.cli.command('rebuild-latest-calibrations')
+def rebuild_latest_calibrations_command():
+    """Rebuild the latestCalibration table from the calibration table"""
+    count = rebuild_latest_calibrations()
+    print(f'Rebuilt latestCalibration with {count} devices')
+
+@bp.cli.command('check-latest-calibrations')
+@click.option('--repair', is_flag=True, help='Recompute the devices that do not match')
+def check_latest_calibrations_command(repair):
+    """Compare latestCalibration with the calibration table; exits 1 on a mismatch"""
+    mismatches = check_latest_calibrations()
+    device_ids = [device_id for found in mismatches.values() for device_id in found]
+    for kind, found in mismatches.items():
+        print(f"{kind}: {len(found)}{' (' + ', '.join(found[:10]) + ')' if found else ''}")
+    if not device_ids:
+        return
+    if repair:
+        update_latest_calibrations(device_ids)
+        db.session.commit()
+        print(f'Repaired {len(device_ids)} devices')
+        return
+    sys.exit(1)
+
+@bp.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Rebuild the local FTS5 search index of every searchable calsys table"""
+    for model in SEARCH_COLUMNS:
+        count = search_index.rebuild(model)
+        if count is None:
+            print('SQLite FTS5 is unavailable')
+            return
+        print(f'Indexed {count} {model.__tablename__} rows')
+
+@bp.cli.command('create-fulltext-indexes')
+def create_fulltext_indexes():
+    """Create the calsys FULLTEXT indexes used when SEARCH_BACKEND=mysql"""
+    search_index.create_fulltext_indexes()
+    print(f'Created FULLTEXT indexes on {len(SEARCH_COLUMNS)} tables')
+
+def cal_export_query(args):
+    """Build the filtered calExport select for a set of request args
+    
+    Without sort_by the rows keep the view's location, name order; pages
+    are ordered by sort_by, name by default, then ID.
+    """
+    stmt = cal_export_select()
+    
+    search = args.get('search')
+    if search:
+        device_ids = search_index.match(Device, search)
+        if device_ids is None:
+            stmt = stmt.where(like_condition(Device, search_terms(search)))
         else:
-            df.to_csv(output, index=False)
-            mimetype = 'text/csv'
-            extension = 'csv'
-        
-        output.seek(0)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        return send_file(
-            output,
-            mimetype=mimetype,
-            as_attachment=True,
-            download_name=f'calibration_due_{timestamp}.{extension}'
-        )
-    
-    return jsonify(data)
+            stmt = stmt.where(Device.ID.in_(device_ids))
+    
+    stmt = filter_view(stmt, args, CAL_EXPORT_FILTERS, Calibration.calDue)
+    
+    sort = view_sort(stmt, args, 'name', 'asc')
+    if 'sort_by' in args:
+        stmt, _ = keyset_order(stmt, Calibration.ID, sort)
+    return stmt, sort
 
 @bp.route('/cal-export', methods=['GET'])
 @login_required
+@conditional(lambda: (table_versions(Calibration, Device, Employee), search_version(Device)))
 def cal_export():
-    """Get calibration export data with export options"""
-    result = get_cal_export(db.session)
-    data = [dict(row) for row in result]
+    """Get calibration export data with filtering, pagination and export options
+    
+    Takes the calibration-due filters, with employee_id in place of period.
+    """
+    latest_calibrations()
+    stmt, sort = cal_export_query(request.args)
     
     if request.args.get('export'):
-        df = pd.DataFrame(data)
         format = request.args.get('format', 'csv')
-        output = io.BytesIO()
-        
-        if format == 'excel':
-            df.to_excel(output, index=False, engine='openpyxl')
-            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            extension = 'xlsx'
+        result = get_cal_export(db.session, stmt, execution_options=STREAM_OPTIONS)
+        return export_result(result, format, 'cal_export')
+    
+    if any(arg in request.args for arg in VIEW_PAGE_ARGS):
+        return jsonify(paginate_view(stmt, Calibration.ID, sort))
+    
+    result = get_cal_export(db.session, stmt, execution_options=STREAM_OPTIONS)
+    return stream_json(result, ndjson=wants_ndjson(request))
+
+@bp.route('/kpis', methods=['GET'])
+@login_required
+def kpis():
+    """Device counts by due-date bucket, grouped in the database
+    
+    ``group_by`` takes a comma separated list of location, typeID,
+    ownerID, period and status; ``buckets`` the day boundaries of the
+    due ranges, 30,60,90 by default. Results are cached for KPI_CACHE_TTL.
+    """
+    group_by = request.args.get('group_by', '')
+    dimensions = [name for name in group_by.split(',') if name]
+    invalid = [name for name in dimensions if name not in KPI_DIMENSIONS]
+    if invalid:
+        return jsonify({'error': f"Invalid group_by dimension: {', '.join(invalid)}"}), 400
+    if len(set(dimensions)) != len(dimensions):
+        return jsonify({'error': 'Duplicate group_by dimension'}), 400
+    
+    buckets = request.args.get('buckets')
+    try:
+        buckets = [int(days) for days in buckets.split(',')] if buckets else list(DEFAULT_BUCKETS)
+    except ValueError:
+        return jsonify({'error': 'Buckets must be whole numbers of days'}), 400
+    if len(buckets) > MAX_BUCKETS or buckets[0] <= 0 or buckets != sorted(set(buckets)):
+        return jsonify({'error': f'Buckets must be up to {MAX_BUCKETS} increasing positive day counts'}), 400
+    
+    today = date.today()
+    groups = kpi_cache.get(
+        (tuple(dimensions), tuple(buckets), today),
+        lambda: calibration_kpis(dimensions, buckets, today)
+    )
+    return jsonify({
+        'as_of': today.isoformat(),
+        'group_by': dimensions,
+        'buckets': buckets,
+        'groups': groups
+    })
+
+def dashboard_due_soon():
+    """Overdue devices and those due within DASHBOARD_DUE_DAYS, soonest first"""
+    state = calibration_due_snapshot()
+    horizon = date.today() + timedelta(days=current_app.config.get('DASHBOARD_DUE_DAYS', 30))
+    result = db.session.execute(
+        calibration_due_select().where(CalibrationDueSnapshot.calDue <= horizon)
+    )
+    return {
+        'refreshed_at': state.refreshed_at.isoformat(),
+        'items': [dict(row._mapping) for row in result]
+    }
+
+def dashboard_status_counts():
+    """Devices per status of their latest calibration"""
+    calibration_due_snapshot()
+    result = db.session.execute(
+        db.select(CalibrationDueSnapshot.status, func.count())
+        .group_by(CalibrationDueSnapshot.status)
+    )
+    return {status: count for status, count in result}
+
+def dashboard_cal_export():
+    latest_calibrations()
+    return [dict(row._mapping) for row in get_cal_export(db.session)]
+
+def dashboard_lookups():
+    lookups = {}
+    for table, model in LOOKUP_TABLES.items():
+        rows = reference_cache.rows(model)
+        if rows is None:
+            serializer = row_serializer(model)
+            rows = serializer.dicts(db.session.execute(db.select(*serializer.columns).order_by(model.name)))
+        lookups[table] = rows
+    return lookups
+
+# Independent dashboard sections, each run on its own worker and connection
+DASHBOARD_SECTIONS = {
+    'calibration_due': dashboard_due_soon,
+    'status_counts': dashboard_status_counts,
+    'cal_export': dashboard_cal_export,
+    'lookups': dashboard_lookups
+}
+
+dashboard_executor = None
+dashboard_executor_lock = threading.Lock()
+
+def dashboard_pool():
+    """Shared worker pool for dashboard sections, sized by DASHBOARD_WORKERS"""
+    global dashboard_executor
+    with dashboard_executor_lock:
+        if dashboard_executor is None:
+            dashboard_executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('DASHBOARD_WORKERS', 4),
+                thread_name_prefix='dashboard'
+            )
+        return dashboard_executor
+
+def run_section(app, section):
+    # A fresh app context gives the worker its own session and pooled connection
+    with app.app_context():
+        use_replicas(db.session)
+        return section()
+
+@bp.route('/dashboard', methods=['GET'])
+@login_required
+def dashboard():
+    """Everything the dashboard needs in one response, sections fetched concurrently
+    
+    ``sections`` (comma separated) picks a subset. A section that fails or
+    takes longer than DASHBOARD_SECTION_TIMEOUT seconds is left out and
+    reported under ``errors``; the rest are still returned.
+    """
+    names = request.args.get('sections')
+    names = [name for name in names.split(',') if name] if names else list(DASHBOARD_SECTIONS)
+    unknown = [name for name in names if name not in DASHBOARD_SECTIONS]
+    if unknown:
+        return jsonify({'error': f"Invalid dashboard section: {', '.join(unknown)}"}), 400
+    
+    app = current_app._get_current_object()
+    pool = dashboard_pool()
+    futures = {name: pool.submit(run_section, app, DASHBOARD_SECTIONS[name]) for name in names}
+    timeout = current_app.config.get('DASHBOARD_SECTION_TIMEOUT', 5)
+    wait(futures.values(), timeout=timeout)
+    
+    sections = {}
+    errors = {}
+    for name, future in futures.items():
+        if not future.done():
+            # Left to finish in the background; its result is discarded
+            errors[name] = f'Timed out after {timeout}s'
+        elif future.exception() is not None:
+            current_app.logger.error('Dashboard section %s failed', name, exc_info=future.exception())
+            errors[name] = 'Failed'
         else:
-            df.to_csv(output, index=False)
-            mimetype = 'text/csv'
-            extension = 'csv'
-        
-        output.seek(0)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        return send_file(
-            output,
-            mimetype=mimetype,
-            as_attachment=True,
-            download_name=f'cal_export_{timestamp}.{extension}'
-        )
-    
-    return jsonify(data)
+            sections[name] = future.result()
+    
+    return jsonify({'sections': sections, 'errors': errors, 'partial': bool(errors)})
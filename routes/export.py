@@ -0,0 +1,121 @@
+from flask import Response, send_file, stream_with_context
+from datetime import date, datetime
+from itertools import chain, islice
+import csv
+import io
+import tempfile
+
+# Rows fetched from the database per round-trip while exporting
+EXPORT_BATCH_SIZE = 1000
+
+# Excel's hard limit on rows per worksheet, header row included
+EXCEL_MAX_ROWS = 1048576
+
+# Rows sampled up front to size Excel columns before anything is written
+EXCEL_WIDTH_SAMPLE = 100
+EXCEL_MAX_COLUMN_WIDTH = 60
+
+EXCEL_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Flush encoded CSV to the client once this many characters are buffered
+CSV_CHUNK_SIZE = 64 * 1024
+
+def export_filename(filename_prefix, extension):
+    """Build a timestamped download name for an export"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f'{filename_prefix}_{timestamp}.{extension}'
+
+def csv_value(value):
+    """Format a single value the way to_dict() serializes it"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def csv_row(row):
+    return [csv_value(value) for value in row]
+
+def csv_chunks(columns, rows, convert=csv_row):
+    """Encode rows to CSV text, yielding chunks of roughly CSV_CHUNK_SIZE
+
+    ``convert`` formats each row; callers that know their column types
+    can pass a precompiled one such as ``RowSerializer.values``.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for row in rows:
+        writer.writerow(convert(row))
+        if buffer.tell() >= CSV_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+def stream_csv(columns, rows, filename_prefix='export', convert=csv_row):
+    """Stream rows to the client as a chunked CSV download"""
+    response = Response(
+        stream_with_context(csv_chunks(columns, rows, convert)),
+        mimetype='text/csv'
+    )
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename={export_filename(filename_prefix, "csv")}'
+    )
+    return response
+
+def excel_width(value):
+    """Estimate the display width of a value in an Excel column"""
+    if isinstance(value, datetime):
+        return 19
+    if isinstance(value, date):
+        return 10
+    return len(str(value)) if value is not None else 0
+
+def write_excel(columns, rows, output, title='Export', max_rows=EXCEL_MAX_ROWS):
+    """Write rows to a streaming write-only workbook
+    
+    Column widths come from the header and a leading sample of rows so
+    the data is only iterated once. Dates and datetimes are written as
+    typed cells. Rows past the per-sheet limit continue on a new sheet.
+    """
+    # openpyxl takes a third of app start-up to import, so only Excel exports load it
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+    
+    rows = iter(rows)
+    sample = list(islice(rows, EXCEL_WIDTH_SAMPLE))
+    widths = [len(str(column)) for column in columns]
+    for row in sample:
+        for index, value in enumerate(row):
+            widths[index] = max(widths[index], excel_width(value))
+    
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = max_rows
+    for row in chain(sample, rows):
+        if sheet_rows >= max_rows:
+            sheet_number = len(workbook.worksheets) + 1
+            sheet = workbook.create_sheet(title if sheet_number == 1 else f'{title} ({sheet_number})')
+            for index, width in enumerate(widths, start=1):
+                sheet.column_dimensions[get_column_letter(index)].width = min(width + 2, EXCEL_MAX_COLUMN_WIDTH)
+            sheet.append(list(columns))
+            sheet_rows = 1
+        sheet.append(list(row))
+        sheet_rows += 1
+    
+    if sheet is None:
+        workbook.create_sheet(title).append(list(columns))
+    workbook.save(output)
+
+def send_excel(columns, rows, filename_prefix='export'):
+    """Build an xlsx download from rows via a temporary file on disk"""
+    output = tempfile.TemporaryFile()
+    write_excel(columns, rows, output, title=filename_prefix[:25])
+    output.seek(0)
+    return send_file(
+        output,
+        mimetype=EXCEL_MIMETYPE,
+        as_attachment=True,
+        download_name=export_filename(filename_prefix, 'xlsx')
+    )
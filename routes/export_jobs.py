@@ -0,0 +1,230 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from models import db
+from models.replicas import use_replicas
+from routes.export import csv_chunks, export_filename, write_excel
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+class ExportJob:
+    """State of a single background export"""
+
+    def __init__(self, key, source, format, args):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.source = source
+        self.format = format
+        self.args = args
+        self.status = 'queued'
+        self.rows = 0
+        self.error = None
+        self.path = None
+        self.extension = 'xlsx' if format == 'excel' else 'csv'
+        self.download_name = export_filename(source.replace('-', '_'), self.extension)
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+
+    @classmethod
+    def from_dict(cls, data, spool_dir):
+        """Rebuild a job from the state another process saved"""
+        job = cls.__new__(cls)
+        job.__dict__.update(data)
+        job.key = None
+        job.args = None
+        job.extension = 'xlsx' if job.format == 'excel' else 'csv'
+        job.path = None
+        if job.status == 'done':
+            job.path = os.path.join(spool_dir, f'{job.id}.{job.extension}')
+        for field in ('created_at', 'started_at', 'finished_at'):
+            if data[field]:
+                setattr(job, field, datetime.fromisoformat(data[field]))
+        return job
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'source': self.source,
+            'format': self.format,
+            'status': self.status,
+            'rows': self.rows,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'download_name': self.download_name
+        }
+
+class ExportJobManager:
+    """Runs exports on a bounded worker pool and spools the files to disk
+
+    Sources are registered as producers taking the request args and
+    returning ``(columns, rows)``; they run inside an app context on the
+    worker thread. Identical requests share one job until it expires.
+    Job state is mirrored to the spool directory so other worker
+    processes can report status and serve the download.
+    """
+
+    def __init__(self, app=None):
+        self.producers = {}
+        self.jobs = {}
+        self.jobs_by_key = {}
+        self.lock = threading.Lock()
+        self.app = None
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EXPORT_SPOOL_DIR', os.path.join(app.instance_path, 'exports'))
+        app.config.setdefault('EXPORT_JOB_WORKERS', 2)
+        app.config.setdefault('EXPORT_JOB_MAX_PENDING', 20)
+        app.config.setdefault('EXPORT_JOB_TTL', 3600)
+
+        self.app = app
+        self.spool_dir = app.config['EXPORT_SPOOL_DIR']
+        self.max_pending = app.config['EXPORT_JOB_MAX_PENDING']
+        self.ttl = timedelta(seconds=app.config['EXPORT_JOB_TTL'])
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.purge_spool()
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config['EXPORT_JOB_WORKERS'],
+            thread_name_prefix='export-job'
+        )
+        app.extensions['export_jobs'] = self
+
+    def register(self, source, producer):
+        """Register the producer that builds rows for an export source"""
+        self.producers[source] = producer
+
+    def job_key(self, source, format, args):
+        """Identify an export by its source, format and filter args"""
+        params = {
+            key: sorted(values) for key, values in args.lists()
+            if key not in ('export', 'format')
+        }
+        payload = json.dumps([source, format, params], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def submit(self, source, format, args):
+        """Queue an export, reusing a live job for the same filters
+
+        Returns ``(job, created)``, or ``(None, False)`` when the queue is full.
+        """
+        key = self.job_key(source, format, args)
+        with self.lock:
+            self.cleanup()
+            job = self.jobs_by_key.get(key)
+            if job is not None and job.status != 'failed':
+                return job, False
+
+            pending = sum(1 for job in self.jobs.values() if job.status in ('queued', 'running'))
+            if pending >= self.max_pending:
+                return None, False
+
+            job = ExportJob(key, source, format, args.copy())
+            self.jobs[job.id] = job
+            self.jobs_by_key[key] = job
+
+        self.save(job)
+        self.executor.submit(self.run, job)
+        return job, True
+
+    def get(self, job_id):
+        """Look up a job by ID, falling back to state saved by other processes"""
+        with self.lock:
+            self.cleanup()
+            job = self.jobs.get(job_id)
+        if job is not None or not is_job_id(job_id):
+            return job
+
+        try:
+            with open(os.path.join(self.spool_dir, f'{job_id}.json')) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        job = ExportJob.from_dict(data, self.spool_dir)
+        if job.finished_at is not None and job.finished_at < datetime.utcnow() - self.ttl:
+            return None
+        return job
+
+    def save(self, job):
+        """Write the job's state next to its spooled file"""
+        path = os.path.join(self.spool_dir, f'{job.id}.json')
+        with open(f'{path}.part', 'w') as f:
+            json.dump(job.to_dict(), f)
+        os.replace(f'{path}.part', path)
+
+    def count_rows(self, job, rows):
+        for row in rows:
+            job.rows += 1
+            yield row
+
+    def run(self, job):
+        """Produce the export file for a job on a worker thread"""
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        self.save(job)
+        path = os.path.join(self.spool_dir, f'{job.id}.{job.extension}')
+        partial = f'{path}.part'
+
+        try:
+            with self.app.app_context():
+                use_replicas(db.session)
+                columns, rows = self.producers[job.source](job.args)
+                rows = self.count_rows(job, rows)
+                if job.format == 'excel':
+                    with open(partial, 'wb') as output:
+                        write_excel(columns, rows, output, title=job.source[:25])
+                else:
+                    with open(partial, 'w', newline='', encoding='utf-8') as output:
+                        for chunk in csv_chunks(columns, rows):
+                            output.write(chunk)
+            os.replace(partial, path)
+            job.path = path
+            job.status = 'done'
+        except Exception as e:
+            self.app.logger.exception('Export job %s failed', job.id)
+            job.status = 'failed'
+            job.error = str(e)
+            if os.path.exists(partial):
+                os.remove(partial)
+        finally:
+            job.finished_at = datetime.utcnow()
+            self.save(job)
+
+    def cleanup(self):
+        """Drop finished jobs past their TTL along with their spooled files
+
+        Callers must hold ``self.lock``.
+        """
+        cutoff = datetime.utcnow() - self.ttl
+        expired = [
+            job for job in self.jobs.values()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job in expired:
+            del self.jobs[job.id]
+            if self.jobs_by_key.get(job.key) is job:
+                del self.jobs_by_key[job.key]
+            for path in (job.path, os.path.join(self.spool_dir, f'{job.id}.json')):
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+    def purge_spool(self):
+        """Remove spooled files left behind past their TTL, e.g. by restarts"""
+        cutoff = time.time() - self.ttl.total_seconds()
+        for name in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, name)
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+def is_job_id(value):
+    """Check that a value looks like a job ID before using it in a path"""
+    return len(value) == 32 and all(c in '0123456789abcdef' for c in value)
+
+export_jobs = ExportJobManager()
@@ -0,0 +1,169 @@
+from sqlalchemy.exc import SQLAlchemyError
+from models import db
+from models.calsys import CalibratedBy, Calibration, Device, Employee, Status
+from models.latest_calibration import update_latest_calibrations
+import os
+
+# Columns an import file may carry; the generated ones are accepted and ignored,
+# so an edited calibration export can be imported as is
+IMPORT_COLUMNS = ('deviceID', 'calibratedByID', 'employeeID', 'calDate', 'calDue', 'status', 'record')
+REQUIRED_COLUMNS = ('deviceID', 'calDate', 'status')
+GENERATED_COLUMNS = ('ID', 'timeStamp', 'created_at', 'updated_at')
+DATE_COLUMNS = ('calDate', 'calDue')
+
+# Table each foreign key column must match an ID of
+FOREIGN_KEYS = {
+    'deviceID': Device,
+    'employeeID': Employee,
+    'status': Status,
+    'calibratedByID': CalibratedBy
+}
+
+# IDs sent per IN (...) lookup while validating
+LOOKUP_BATCH_SIZE = 1000
+
+IMPORT_EXTENSIONS = {'.csv': 'csv', '.xlsx': 'excel', '.xlsm': 'excel'}
+
+# Spreadsheet row number of the first data row, below the header
+FIRST_ROW = 2
+
+def upload_format(filename, format=None):
+    """csv or excel, from the format arg or else the file extension"""
+    if format:
+        if format not in ('csv', 'excel'):
+            raise ValueError('Invalid format, expected csv or excel')
+        return format
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in IMPORT_EXTENSIONS:
+        raise ValueError('Unsupported file type, expected .csv or .xlsx')
+    return IMPORT_EXTENSIONS[extension]
+
+def read_upload(file, format):
+    """Rows of an uploaded file as a frame of stripped strings, None where blank
+
+    Every cell is read as text so IDs keep their leading zeros; pandas and
+    openpyxl are only imported here, keeping them out of app start-up.
+    """
+    import pandas as pd
+
+    try:
+        if format == 'csv':
+            frame = pd.read_csv(file, dtype=str, keep_default_na=False)
+        else:
+            frame = pd.read_excel(file, dtype=str, keep_default_na=False, engine='openpyxl')
+    except Exception as error:
+        raise ValueError(f'Could not read the file: {error}')
+
+    frame.columns = [str(name).strip() for name in frame.columns]
+    unknown = [name for name in frame.columns if name not in IMPORT_COLUMNS + GENERATED_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    missing = [name for name in REQUIRED_COLUMNS if name not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    frame = frame.reindex(columns=IMPORT_COLUMNS, fill_value='')
+    frame = frame.apply(lambda values: values.str.strip())
+    # Numeric spreadsheet cells come back as 42.0
+    frame['deviceID'] = frame['deviceID'].str.replace(r'\.0$', '', regex=True)
+    return frame.where(frame != '', None)
+
+def existing_ids(model, values):
+    """The subset of ``values`` that are IDs of ``model``, as strings"""
+    if model.ID.type.python_type is int:
+        values = [int(value) for value in values if value.isdigit()]
+    found = set()
+    for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+        found.update(db.session.execute(
+            db.select(model.ID).where(model.ID.in_(values[start:start + LOOKUP_BATCH_SIZE]))
+        ).scalars())
+    return {str(value) for value in found}
+
+def recorded_calibrations(device_ids, dates):
+    """(deviceID, calDate) pairs already recorded for these devices within the dates' range"""
+    dates = [value for value in dates if value is not None]
+    if not dates:
+        return set()
+    pairs = set()
+    for start in range(0, len(device_ids), LOOKUP_BATCH_SIZE):
+        pairs.update(db.session.execute(
+            db.select(Calibration.deviceID, Calibration.calDate)
+            .where(Calibration.deviceID.in_(device_ids[start:start + LOOKUP_BATCH_SIZE]))
+            .where(Calibration.calDate.between(min(dates), max(dates)))
+        ).tuples())
+    return pairs
+
+def validate_calibrations(frame):
+    """Check every row of an import frame at once, column by column
+
+    Returns the insertable rows with their spreadsheet row numbers, and
+    one error per failed check as ``{row, column, value, error}``.
+    """
+    import pandas as pd
+
+    errors = []
+
+    def flag(mask, column, message):
+        for index, value in frame.loc[mask, column].items():
+            errors.append({'row': int(index) + FIRST_ROW, 'column': column, 'value': value, 'error': message})
+
+    for column in REQUIRED_COLUMNS:
+        flag(frame[column].isna(), column, 'Required')
+
+    for column in IMPORT_COLUMNS:
+        length = Calibration.__table__.c[column].type.length if column not in DATE_COLUMNS else None
+        if length:
+            flag(frame[column].str.len() > length, column, f'Longer than {length} characters')
+
+    dates = {}
+    for column in DATE_COLUMNS:
+        parsed = pd.to_datetime(frame[column], errors='coerce', format='ISO8601')
+        flag(frame[column].notna() & parsed.isna(), column, 'Invalid date, expected YYYY-MM-DD')
+        dates[column] = parsed
+    flag(dates['calDue'] < dates['calDate'], 'calDue', 'Before calDate')
+
+    for column, model in FOREIGN_KEYS.items():
+        present = frame[column].notna()
+        found = existing_ids(model, list(frame.loc[present, column].unique()))
+        flag(present & ~frame[column].isin(found), column, f'No such {model.__tablename__}')
+
+    cal_dates = dates['calDate'].dt.date.astype(object).where(dates['calDate'].notna(), None)
+    keys = pd.DataFrame({'deviceID': frame['deviceID'], 'calDate': cal_dates})
+    complete = keys['deviceID'].notna() & keys['calDate'].notna()
+    flag(complete & keys.duplicated(keep='first'), 'calDate', 'Same device and date as an earlier row')
+    recorded = recorded_calibrations(list(keys.loc[complete, 'deviceID'].unique()), keys['calDate'].unique())
+    if recorded:
+        pairs = pd.MultiIndex.from_frame(keys)
+        flag(complete & pairs.isin(list(recorded)), 'calDate', 'Already recorded for this device')
+
+    records = frame.copy()
+    for column in DATE_COLUMNS:
+        records[column] = dates[column].dt.date.astype(object).where(dates[column].notna(), None)
+    invalid = {error['row'] - FIRST_ROW for error in errors}
+    records = records.drop(index=list(invalid))
+
+    errors.sort(key=lambda error: (error['row'], IMPORT_COLUMNS.index(error['column'])))
+    rows = [int(index) + FIRST_ROW for index in records.index]
+    return list(zip(rows, records.to_dict('records'))), errors
+
+def insert_calibrations(rows, batch_size):
+    """Insert validated rows with one executemany and commit per batch
+
+    Each batch also updates the latest calibration of its devices. Returns
+    the number of rows inserted and, if a batch failed and was rolled
+    back, ``{rows: [first, last], error}`` for it; later batches are not
+    attempted.
+    """
+    inserted = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        records = [record for _, record in batch]
+        try:
+            db.session.execute(Calibration.__table__.insert(), records, bind_arguments={'mapper': Calibration})
+            update_latest_calibrations({record['deviceID'] for record in records})
+            db.session.commit()
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            return inserted, {'rows': [batch[0][0], batch[-1][0]], 'error': str(getattr(error, 'orig', None) or error)}
+        inserted += len(batch)
+    return inserted, None